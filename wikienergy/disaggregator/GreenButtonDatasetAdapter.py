@@ -56,7 +56,7 @@ def get_trace(xml_string):
     datetimes = [datetime.fromtimestamp(int(dt.childNodes[0].nodeValue))
                  for dt in datetimes]
 
-    series = pd.Series(values,index=datetimes)
+    series = pd.Series(values,index=datetimes).astype(np.float64)
     metadata = {'source': 'GreenButtonXML'}
     trace = ApplianceTrace(series,metadata)
 
@@ -24,12 +24,20 @@ import calendar
 import copy
 
 source = "OakPark"
+_db = None
 
 def get_db_connection():
-    connection = pymongo.MongoClient('ds059938.mongolab.com',59938)
-    db = connection['oakparkhistoric']
-    db.authenticate('anonymouseenergy', 'KaTard3i3')
-    return db
+    '''
+    Returns the Oak Park database. The client, and with it its connection
+    pool, is created on the first call and shared by later calls.
+    '''
+    global _db
+    if _db is None:
+        connection = pymongo.MongoClient('ds059938.mongolab.com',59938)
+        db = connection['oakparkhistoric']
+        db.authenticate('anonymouseenergy', 'KaTard3i3')
+        _db = db
+    return _db
 
 def get_homes(db):
     """
@@ -9,25 +9,29 @@
 
 """
 import appliance as app
+import utils
 import pandas as pd
 import numpy as np
 import csv
 import glob
 import os
 from datetime import datetime
-import decimal
 #####TO DO - incorporate TRACE_LENGTH
 class TracebaseDatasetAdapter(object):
 
-    def __init__(self,path,trace_length='D',sample_rate='15T'):
+    def __init__(self,path,trace_length='D',sample_rate='15T',
+            storage='float64'):
         '''
         Consider the following path:
         path = '/home/steve/DSSG/tracebase/complete/'
         trace_length='D', using Offset Aliases Pandas object notation
         sample_rate = "15T", using Offset Aliases Pandas object notation
+        storage = "float64", "int64" or "decimal" (see
+        utils.convert_series_storage)
         '''
         self.path=path
         self.sample_rate=sample_rate
+        self.storage=storage
         self.source='Tracebase'
 
     def get_trace_dates_from_instance(self,device,instance):
@@ -55,15 +59,17 @@ class TracebaseDatasetAdapter(object):
         df['time']=pd.to_datetime(df['time'], format='%d/%m/%Y %H:%M:%S')
         df.set_index('time', inplace=True)
         try:
-	    series=df['1s_W'].resample(self.sample_rate,how='mean')
-	    series=series.map(decimal.Decimal)/decimal.Decimal(1000.0)
+            series=df['1s_W'].resample(self.sample_rate,how='mean')
+            series=series.astype(np.float64)/1000.0
             series.name=device
         except ValueError:
-	    raise SampleError(self.sample_rate)
+            raise SampleError(self.sample_rate)
         series_mult=self.split_on_NANs(series)
-        return [app.ApplianceTrace(single_series,{'source':self.source,
-            'device_name':device,'instance_name':instance_id ,'date':date,
-            'trace_num':i}) for i,single_series in enumerate(series_mult)]
+        return [app.ApplianceTrace(
+            utils.convert_series_storage(single_series,self.storage),
+            {'source':self.source, 'device_name':device,
+            'instance_name':instance_id ,'date':date, 'trace_num':i})
+            for i,single_series in enumerate(series_mult)]
 
     def split_on_NANs(self,series):
         '''
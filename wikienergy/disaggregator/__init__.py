@@ -21,5 +21,9 @@ import GreenButtonDatasetAdapter
 import utils
 import appliance
 import fhmm
+import discrete_hmm
 import generate
 import weather
+import cache
+import sweep
+import registry
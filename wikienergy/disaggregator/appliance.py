@@ -16,7 +16,6 @@ import pandas as pd
 import pprint
 from utils import order_traces
 import utils
-import decimal
 import json
 import warnings
 
@@ -42,6 +41,12 @@ class ApplianceTrace(object):
         '''
         return self.series.index.freq
 
+    def get_start_time(self):
+        '''
+        Returns the time of the first reading of the trace.
+        '''
+        return self.series.index[0]
+
     def get_time_of_day(self, start_time, end_time):
         '''
         Given a start and end datetime.time, it returns a trace
@@ -52,16 +57,20 @@ class ApplianceTrace(object):
 
     def get_windows(self, window_length, window_step):
         """
-        Returns a numpy array with stacked sliding windows of data.
+        Returns a numpy array with stacked sliding windows of data. The array
+        is a read-only strided view on the series values; copy it before
+        modifying it in place.
+        """
+        return utils.get_window_view(self.series.values,window_length,
+                                     window_step)
+
+    def get_window_reductions(self, window_length, window_step, how='sum'):
+        """
+        Returns a numpy array with the sum, mean or max of each sliding window
+        of data, without materializing the windows.
         """
-        total_length = self.series.size
-        n_steps = int((total_length - window_length) / window_step)
-        windows = []
-        for step in range(n_steps):
-            start = step * window_step
-            window = self.series[start:start + window_length].tolist()
-            windows.append(window)
-        return np.array(windows,dtype=np.float)
+        return utils.get_window_reductions(self.series.values,window_length,
+                                           window_step,how)
 
     def get_total_usage(self):
         '''
@@ -84,46 +93,46 @@ class ApplianceTrace(object):
         print 'Metadata: '
         pprint.pprint(self.metadata)
 
-    def resample(self,sample_rate, method='mean'):
+    def resample(self,sample_rate, method='mean', storage='float64'):
         '''
         Returns a new trace resampled to a given sample rate, defined by the
         offset aliases described in panda time series.
         http://pandas.pydata.org/pandas-docs/stable/timeseries.html#offset-aliases
+
+        The resampled series is stored as float64 unless another storage mode
+        is requested (see `utils.convert_series_storage`).
         '''
 
         try:
-            new_series = self.series.astype(float)
-            new_series = new_series.resample(sample_rate,how=method)
-            new_series = new_series.fillna(0)
-            new_series = new_series.map(decimal.Decimal)
-            new_series.name = self.series.name
+            return utils.resample_traces([self],sample_rate,method,storage)[0]
         except ValueError:
             raise utils.SampleError(sample_rate)
+
+    def to_storage(self, storage='float64', scale=1000):
+        '''
+        Returns a new trace with the series converted to the given storage
+        mode: 'float64', 'int64' (fixed-point in units of 1/scale) or
+        'decimal'.
+        '''
+        new_series = utils.convert_series_storage(self.series,storage,scale)
         return ApplianceTrace(new_series,self.metadata)
 
     def split_by(self,rate):
         '''
-        Returns a list of traces formed by splitting this trace by day ('D')
-        or week ('W')
+        Returns a list of traces formed by splitting this trace by day ('D'),
+        week ('W') or month ('M'). The traces are views on this trace's
+        series which are only sliced when first used.
         '''
-        # set rate to group by
-        if rate == 'D' or rate == '1D':
-            groupby_rate = self.series.index.date
-        elif rate == 'W' or rate == '1W':
-            groupby_rate = self.series.index.week
-
-        elif rate == 'M' or rate== '1M':
-            groupby_rate = self.series.index.month
+        return list(self.iter_split_by(rate))
 
-        else:
-            raise NotImplementedError('Looking for "week" or "day"')
-
-        traces=[]
-        for i, group in enumerate(self.series.groupby(groupby_rate)):
-            metadata = dict.copy(self.metadata)
-            metadata['trace_num'] = i
-            traces.append(ApplianceTrace(group[1],metadata))
-        return traces
+    def iter_split_by(self,rate):
+        '''
+        Yields the traces formed by splitting this trace by day ('D'), week
+        ('W') or month ('M'), as in split_by.
+        '''
+        boundaries = utils.get_split_boundaries(self.series.index,rate).tolist()
+        for i,(start,stop) in enumerate(zip(boundaries[:-1],boundaries[1:])):
+            yield ApplianceTraceView(self.series,start,stop,self.metadata,i)
 
     def to_daily_usage_json(self,method='utc_dict'):
         '''
@@ -176,6 +185,63 @@ class ApplianceTrace(object):
         return data[start:end]
 
 
+class ApplianceTraceView(ApplianceTrace):
+    """This class represents a trace which is a consecutive slice of another
+    trace's series, as returned by ApplianceTrace.split_by.
+
+    The sliced series, which shares its values with the parent series, and
+    the metadata are only created when first accessed. Views are pickled as
+    plain ApplianceTraces.
+    """
+
+    _series = None
+    _metadata = None
+
+    def __init__(self, parent_series, start, stop, parent_metadata,
+                 trace_num):
+        '''
+        Initializes a view on parent_series[start:stop], which is trace
+        number trace_num of the parent trace.
+        '''
+        self._parent_series = parent_series
+        self._start = start
+        self._stop = stop
+        self._parent_metadata = parent_metadata
+        self._trace_num = trace_num
+
+    @property
+    def series(self):
+        if self._series is None:
+            self._series = self._parent_series.iloc[self._start:self._stop]
+        return self._series
+
+    @series.setter
+    def series(self, series):
+        self._series = series
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = dict.copy(self._parent_metadata)
+            self._metadata['trace_num'] = self._trace_num
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, metadata):
+        self._metadata = metadata
+
+    def get_start_time(self):
+        '''
+        Returns the time of the first reading of the trace.
+        '''
+        if self._series is None:
+            return self._parent_series.index[self._start]
+        return self._series.index[0]
+
+    def __reduce__(self):
+        return (ApplianceTrace,(self.series,self.metadata))
+
+
 class ApplianceInstance(object):
     """
     This class represents appliance instances, which may have multiple
@@ -187,9 +253,16 @@ class ApplianceInstance(object):
     """
 
 
-    def __init__(self,traces,metadata):
-        '''Initialize an appliance trace with a list of ApplianceTraces'''
-        self.traces = order_traces(traces)
+    def __init__(self,traces,metadata,sort_traces=True):
+        '''
+        Initialize an appliance trace with a list of ApplianceTraces. The
+        traces are sorted by start time unless sort_traces is False, in which
+        case they must already be in order.
+        '''
+        if sort_traces:
+            self.traces = order_traces(traces)
+        else:
+            self.traces = list(traces)
         self.metadata=metadata
 
     def concatenate_traces(self, how="strict"):
@@ -211,14 +284,15 @@ class ApplianceInstance(object):
             new_traces.append(trace.get_time_of_day(start_time,end_time))
         return ApplianceInstance(new_traces,self.metadata)
 
-    def resample(self,sample_rate):
+    def resample(self,sample_rate,method='mean',storage='float64',
+                 split_by=None):
         '''
-        Returns an instance with resampled traces.
+        Returns an instance with resampled traces. If split_by is given, the
+        resampled traces are also split by day ('D'), week ('W') or month
+        ('M') in the same pass.
         '''
-        new_traces = []
-        for trace in self.traces:
-            new_traces.append(trace.resample(sample_rate))
-        return ApplianceInstance(new_traces,self.metadata)
+        return utils.resample_instances([self],sample_rate,method,storage,
+                                        split_by)[0]
 
     def split_by(self,rate):
         '''
@@ -227,8 +301,8 @@ class ApplianceInstance(object):
         '''
         traces=[]
         for trace in self.traces:
-            traces.extend(trace.split_by(rate))
-        return ApplianceInstance(traces,self.metadata)
+            traces.extend(trace.iter_split_by(rate))
+        return ApplianceInstance(traces,self.metadata,sort_traces=False)
 
 
 class ApplianceSet(object):
@@ -240,56 +314,87 @@ class ApplianceSet(object):
     algorithms, representing a particular home, building, or metered unit.
 
     """
-    def __init__(self,instances,metadata):
+    def __init__(self,instances,metadata,validate=True,matrix_source=None):
         '''
-        Initializes an appliance set given a list of instances.
+        Initializes an appliance set given a list of instances. Unless
+        validate is False, misaligned instances are aligned; pass
+        validate=False only for instances which are known to be aligned.
+        matrix_source may be a (matrix,indices) pair of a shared (time x
+        instance) matrix and the columns of the instances in it, from which
+        the set's matrix is taken when first requested.
         '''
-        if not utils.instances_aligned(instances):
+        if validate and not utils.instances_aligned(instances):
             self.instances = utils.align_instances(instances)
             warnings.warn("Aligning misaligned traces using default procedure")
         else:
             self.instances = instances
         self.metadata = metadata
+        self._matrix = None
+        self._matrix_source = matrix_source
 
     def generate_top_k_set(self,k):
         '''
         Get top k energy-consuming appliances
         '''
-        # TODO compare speeds of individual instance summing vs dataframe building and summing
         # TODO more intelligently create the metadata
-        df = get_dataframe()
-        total_usages = df.sum(axis=0)
-        usage_order = np.argsort(total_usages)[::-1] # assumes correctly ordered columns
-        top_k_instances = [self.instances[i] for i in usage_order[:k]]
-        return ApplianceSet(top_k_instances,
-                            {"name":"top_{}".format(k)})
+        total_usages = self.get_usage_totals()
+        usage_order = np.argsort(total_usages,kind='mergesort')[::-1]
+        return self._get_subset(usage_order[:k],{"name":"top_{}".format(k)})
 
     def generate_non_zero_set(self):
         '''
         Get all energy-consuming appliances (and drop instances with traces
         with all zeros)
         '''
-        # TODO compare speeds of individual instance summing vs dataframe building and summing
         # TODO intelligently create the metadata
-        df = get_dataframe()
-        total_usages = df.sum(axis=0)
-        usage_order = np.argsort(total_usages)[::-1] # assumes correctly ordered columns
-        non_zero_instances = [self.instances[i] for i in usage_order if total_usages[i] > 0 ]
-        return ApplianceSet(non_zero_instances,
-                            {"name":"non_zero"})
-
+        total_usages = self.get_usage_totals()
+        usage_order = np.argsort(total_usages,kind='mergesort')[::-1]
+        non_zero = usage_order[total_usages[usage_order] > 0]
+        return self._get_subset(non_zero,{"name":"non_zero"})
+
+    def get_matrix(self):
+        '''
+        Returns a (time x appliance) array of the first trace of each
+        instance, with a column for each instance in order. Values are
+        float64, with int64 fixed-point traces converted to their float
+        values. The array is
+        built once and cached, so the set should not be modified afterwards.
+        Bootstrapped sets take their columns from the shared matrix they
+        were sampled from.
+        '''
+        if self._matrix is None and self._matrix_source is not None:
+            source_matrix, indices = self._matrix_source
+            self._matrix = np.asfortranarray(source_matrix[:,indices])
+        if self._matrix is None:
+            series = [instance.traces[0].series for instance in self.instances]
+            matrix = np.empty((len(series[0]),len(series)),order='F')
+            for i,s in enumerate(series):
+                matrix[:,i] = utils.convert_series_storage(s).values
+            self._matrix = matrix
+        return self._matrix
+
+    def get_usage_totals(self):
+        '''
+        Returns an array of the total usage of each instance, ignoring NaNs.
+        '''
+        return np.nansum(self.get_matrix(),axis=0)
 
     def get_dataframe(self):
         '''
-        Makes a new dataframe of the appliance instances. Throws an exception if
-        if the appliance instances have traces that don't align.
+        Makes a new dataframe of the appliance instances, with a column for
+        each instance in order, from the cached matrix.
         '''
-        # TODO concatenate all traces into a single trace
-        # TODO change this to ordered dict
-        # TODO actually throw an exception
-        series_dict = {instance.traces[0].series.name:instance.traces[0].series
-                       for instance in self.instances}
-        return pd.DataFrame.from_dict(series_dict)
+        index = self.instances[0].traces[0].series.index
+        columns = [instance.traces[0].series.name
+                   for instance in self.instances]
+        return pd.DataFrame(self.get_matrix(),index=index,columns=columns)
+
+    def _get_subset(self,indices,metadata):
+        subset = ApplianceSet([self.instances[i] for i in indices],metadata,
+                              validate=False)
+        if self._matrix is not None and len(indices) > 0:
+            subset._matrix = np.asfortranarray(self._matrix[:,indices])
+        return subset
 
     def get_time_of_day(self,start_time,end_time):
         '''
@@ -300,14 +405,16 @@ class ApplianceSet(object):
         for instance in self.instances:
             new_instances.append(instance.get_time_of_day(start_time,end_time))
         return ApplianceType(new_instances,self.metadata)
-    def resample(self, sample_rate):
+    def resample(self, sample_rate, method='mean', storage='float64',
+                 split_by=None):
         '''
-        Returns a new ApplianceSet instance with resampled traces.
+        Returns a new ApplianceSet instance with resampled traces, all of
+        which are resampled together. If split_by is given, the resampled
+        traces are also split by day ('D'), week ('W') or month ('M').
         '''
-        new_instances=[]
-        for instance in self.instances:
-            new_instances.append(instance.resample(sample_rate))
-        return ApplianceSet(new_instances,self.metadata)
+        new_instances = utils.resample_instances(self.instances,sample_rate,
+                                                 method,storage,split_by)
+        return ApplianceSet(new_instances,self.metadata,validate=False)
 
     def split_by(self, rate):
         '''
@@ -318,7 +425,7 @@ class ApplianceSet(object):
         for instance in self.instances:
             new_instance = instance.split_by(rate)
             instances.append(new_instance)
-        return ApplianceSet(instances,self.metadata)
+        return ApplianceSet(instances,self.metadata,validate=False)
 
 class ApplianceType(object):
     """This class represents appliance types, which contain a set of
@@ -359,13 +466,15 @@ class ApplianceType(object):
             new_instances.append(instance.get_time_of_day(start_time,end_time))
         return ApplianceSet(new_instances,self.metadata)
 
-    def resample(self,sample_rate):
+    def resample(self,sample_rate,method='mean',storage='float64',
+                 split_by=None):
         '''
-        Returns a new ApplianceType with resampled traces.
+        Returns a new ApplianceType with resampled traces, all of which are
+        resampled together. If split_by is given, the resampled traces are
+        also split by day ('D'), week ('W') or month ('M').
         '''
-        new_instances=[]
-        for instance in self.instances:
-            new_instances.append(instance.resample(sample_rate))
+        new_instances = utils.resample_instances(self.instances,sample_rate,
+                                                 method,storage,split_by)
         return ApplianceType(new_instances,self.metadata)
 
     def split_by(self, rate):
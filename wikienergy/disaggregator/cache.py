@@ -0,0 +1,223 @@
+"""
+.. module:: cache
+   :platform: Unix
+   :synopsis: Contains a persistent on-disk cache for data fetched by the
+      dataset adapters.
+
+.. moduleauthor:: Phil Ngo <ngo.phil@gmail.com>
+.. moduleauthor:: Miguel Perez <miguel.a.perez4@gmail.com>
+.. moduleauthor:: Stephen Suffian <stephen.suffian@gmail.com>
+.. moduleauthor:: Sabina Tomkins <sabina.tomkins@gmail.com>
+
+"""
+
+import numpy as np
+import pandas as pd
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import threading
+
+class TraceCache(object):
+    """This class represents a read-through cache of arrays on disk.
+
+    Each entry is a set of named numpy arrays stored in its own uncompressed
+    .npz file and keyed by the query parameters that produced it. An index
+    file keeps the content hash and size of every entry so that corrupt
+    entries are discarded, and the least recently used entries are evicted
+    once the cache grows beyond max_bytes. The last access time of an entry
+    is the modification time of its file, which is touched on every hit, so
+    reads do not rewrite the index. Changes to the index are made under a
+    file lock and merged with the index on disk, so that several processes
+    can share a cache.
+
+    In offline mode, a cache miss raises a CacheMissError instead of letting
+    the caller fall back to the database.
+    """
+
+    def __init__(self, path, max_bytes=None, offline=False):
+        '''
+        Initializes a cache in the directory at path, creating it if needed.
+        '''
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offline = offline
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.index_path = os.path.join(path,'index.json')
+        self.lock_path = os.path.join(path,'index.lock')
+        self._lock = threading.RLock()
+        self.index = self._load_index()
+        with self._update_index():
+            self._evict()
+
+    def get(self, key):
+        '''
+        Returns the dict of arrays stored under key, or None if there is no
+        valid entry. Raises a CacheMissError on a miss in offline mode.
+        '''
+        with self._lock:
+            if key not in self.index:
+                # the entry may have been added by another process
+                self.index = self._load_index()
+            entry = self.index.get(key)
+            if entry is not None:
+                try:
+                    with np.load(self._entry_path(key)) as data:
+                        arrays = {name: data[name] for name in data.files}
+                except (IOError, ValueError):
+                    arrays = None
+                if (arrays is not None and
+                        _hash_arrays(arrays) == entry['hash']):
+                    try:
+                        os.utime(self._entry_path(key),None)
+                    except OSError:
+                        pass
+                    return arrays
+                self.remove(key)
+        if self.offline:
+            raise CacheMissError(key)
+        return None
+
+    def put(self, key, arrays):
+        '''
+        Stores a dict of arrays under key, then evicts the least recently used
+        entries if the cache is larger than max_bytes.
+        '''
+        with self._lock:
+            entry_path = self._entry_path(key)
+            temp_path = '{}.{}.tmp'.format(entry_path,os.getpid())
+            with open(temp_path,'wb') as f:
+                np.savez(f,**arrays)
+            os.rename(temp_path,entry_path)
+            with self._update_index():
+                self.index[key] = {'hash': _hash_arrays(arrays),
+                                   'bytes': os.path.getsize(entry_path)}
+                self._evict()
+
+    def remove(self, key):
+        '''
+        Removes the entry stored under key, if any.
+        '''
+        with self._update_index():
+            self._remove_entry(key)
+
+    def get_size(self):
+        '''
+        Returns the total size in bytes of the cached entries.
+        '''
+        with self._lock:
+            return sum(entry['bytes'] for entry in self.index.values())
+
+    def _evict(self):
+        if self.max_bytes is None or self.get_size() <= self.max_bytes:
+            return
+        by_access = sorted(self.index,key=self._get_last_access)
+        size = self.get_size()
+        for key in by_access:
+            if size <= self.max_bytes:
+                break
+            size -= self.index[key]['bytes']
+            self._remove_entry(key)
+
+    def _remove_entry(self, key):
+        self.index.pop(key,None)
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def _get_last_access(self, key):
+        try:
+            return os.path.getmtime(self._entry_path(key))
+        except OSError:
+            return 0
+
+    def _entry_path(self, key):
+        return os.path.join(self.path,'{}.npz'.format(key))
+
+    def _load_index(self):
+        try:
+            with open(self.index_path,'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    @contextlib.contextmanager
+    def _update_index(self):
+        '''
+        Holds the thread lock and an exclusive lock on the lock file while
+        the index is changed. The index is reloaded from disk first, so that
+        changes made by other processes are kept, and saved afterwards.
+        '''
+        with self._lock:
+            with open(self.lock_path,'a') as lock_file:
+                fcntl.flock(lock_file,fcntl.LOCK_EX)
+                try:
+                    self.index = self._load_index()
+                    yield
+                    self._save_index()
+                finally:
+                    fcntl.flock(lock_file,fcntl.LOCK_UN)
+
+    def _save_index(self):
+        temp_path = '{}.{}.tmp'.format(self.index_path,os.getpid())
+        with open(temp_path,'w') as f:
+            json.dump(self.index,f)
+        os.rename(temp_path,self.index_path)
+
+def get_key(*params):
+    '''
+    Returns a cache key for the given query parameters, such as
+    (schema, table, dataid, columns, sample_rate).
+    '''
+    encoded = json.dumps([list(p) if isinstance(p,(list,tuple)) else p
+                          for p in params], default=str)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+def series_to_arrays(series_list):
+    '''
+    Returns a dict of arrays holding a list of series sharing a single
+    DatetimeIndex, in a form which can be stored in a TraceCache.
+    '''
+    index = series_list[0].index
+    arrays = {'index': index.asi8,
+              'names': np.array([str(s.name) for s in series_list]),
+              'tz': np.array(str(index.tz) if index.tz else ''),
+              'freq': np.array(index.freqstr or '')}
+    for i, series in enumerate(series_list):
+        arrays['values_{}'.format(i)] = series.values
+    return arrays
+
+def arrays_to_series(arrays):
+    '''
+    Returns the list of series stored with `series_to_arrays`.
+    '''
+    index = pd.DatetimeIndex(arrays['index'])
+    tz = str(arrays['tz'])
+    if tz:
+        index = index.tz_localize('UTC').tz_convert(tz)
+    freq = str(arrays['freq'])
+    if freq:
+        index = pd.DatetimeIndex(index,freq=freq)
+    return [pd.Series(arrays['values_{}'.format(i)],index=index,name=name)
+            for i, name in enumerate(arrays['names'].tolist())]
+
+def _hash_arrays(arrays):
+    sha = hashlib.sha1()
+    for name in sorted(arrays):
+        sha.update(name.encode('utf-8'))
+        sha.update(np.ascontiguousarray(arrays[name]).tostring())
+    return sha.hexdigest()
+
+class CacheMissError(Exception):
+    """
+    Exception raised when data is missing from a cache in offline mode.
+    """
+    def __init__(self, key):
+        self.key = key
+
+    def __str__(self):
+        return "No cached data for key {} (cache is offline)".format(self.key)
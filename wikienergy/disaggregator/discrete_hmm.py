@@ -0,0 +1,308 @@
+"""
+.. module:: discrete_hmm
+   :platform: Unix
+   :synopsis: Contains a vectorized hidden Markov model for discrete
+      observations, with scaled forward, backward and Baum-Welch algorithms
+      and a log-space Viterbi algorithm, which run over batches of equal
+      length sequences.
+
+.. moduleauthor:: Phil Ngo <ngo.phil@gmail.com>
+.. moduleauthor:: Miguel Perez <miguel.a.perez4@gmail.com>
+.. moduleauthor:: Stephen Suffian <stephen.suffian@gmail.com>
+.. moduleauthor:: Sabina Tomkins <sabina.tomkins@gmail.com>
+
+Adapted from the hidden Markov model of Michael Hamilton in proto/HMM, after
+Rabiner, 1989.
+"""
+
+import numpy as np
+import multiprocessing
+import time
+
+_batches = None
+
+class DiscreteHMM(object):
+    """This class represents a hidden Markov model with discrete observation
+    symbols.
+
+    A is the (N,N) transition matrix, where A[i,j] = P(q_t = j|q_t-1 = i), B
+    is the (N,M) emission matrix, where B[i,k] = P(V[k] at t|q_t = i), and Pi
+    is the initial state distribution. Rows of B listed in the fixed dict F
+    are held fixed during training.
+    """
+
+    def __init__(self, n_states, V, A=None, B=None, Pi=None, F=None):
+        '''
+        Initializes an HMM with n_states hidden states over the observation
+        symbols V. A and B are initialized randomly and Pi uniformly if they
+        are not given.
+        '''
+        self.N = n_states
+        self.V = np.asarray(V)
+        self.M = len(self.V)
+        if A is None:
+            A = np.random.uniform(size=(self.N,self.N))
+            A = A / A.sum(axis=1)[:,np.newaxis]
+        self.A = np.asarray(A,dtype=np.float64).reshape((self.N,self.N))
+        if B is None:
+            B = np.random.uniform(size=(self.N,self.M))
+            B = B / B.sum(axis=1)[:,np.newaxis]
+        self.B = np.array(B,dtype=np.float64).reshape((self.N,self.M))
+        if Pi is None:
+            Pi = np.ones(self.N) / self.N
+        self.Pi = np.asarray(Pi,dtype=np.float64)
+        self.F = F if F is not None else {}
+        for i in self.F:
+            self.B[i,:] = self.F[i]
+        self._lookup = _get_symbol_lookup(self.V)
+
+    def get_symbol_indices(self, observations):
+        '''
+        Returns an integer array of the same shape as observations with the
+        index of each observation symbol in V. Raises a ValueError for
+        unknown symbols.
+        '''
+        return self._lookup(np.asarray(observations))
+
+    def __repr__(self):
+        return ("num hiddens: %d\n" % self.N +
+                "symbols: %s\n" % self.V +
+                "\nA:\n %s\n" % str(self.A) +
+                "Pi:\n %s" % str(self.Pi))
+
+def forward(hmm, observations):
+    '''
+    Runs the scaled forward algorithm over a sequence of T symbols or a (S,T)
+    array of S sequences. Returns the log likelihood of each sequence, the
+    normalized forward probabilities of shape (S,T,N) and the (S,T) scaling
+    factors, whose logs sum to the log likelihood. For a single sequence,
+    the leading dimension is dropped.
+    '''
+    indices, single = _get_batch_indices(hmm,observations)
+    alpha, scales = _forward(hmm,indices)
+    log_prob = np.log(scales).sum(axis=1)
+    if single:
+        return log_prob[0], alpha[0], scales[0]
+    return log_prob, alpha, scales
+
+def backward(hmm, observations, scales):
+    '''
+    Runs the backward algorithm over a sequence or (S,T) array of sequences,
+    using the scaling factors returned by forward. Returns the scaled
+    backward probabilities of shape (S,T,N), such that forward * backward
+    gives the posterior probability of each state.
+    '''
+    indices, single = _get_batch_indices(hmm,observations)
+    scales = np.atleast_2d(scales)
+    beta = _backward(hmm,indices,scales)
+    if single:
+        return beta[0]
+    return beta
+
+def viterbi(hmm, observations):
+    '''
+    Returns the most likely state sequence and its log probability for a
+    sequence, or an (S,T) array of state sequences and an array of log
+    probabilities for an (S,T) array of sequences.
+    '''
+    indices, single = _get_batch_indices(hmm,observations)
+    n_sequences, n_samples = indices.shape
+    with np.errstate(divide='ignore'):
+        log_A = np.log(hmm.A)
+        log_B = np.log(hmm.B)
+        delta = np.log(hmm.Pi) + log_B[:,indices[:,0]].T
+    psi = np.empty((n_sequences,n_samples,hmm.N),dtype=np.intp)
+    for t in xrange(1,n_samples):
+        scores = delta[:,:,np.newaxis] + log_A
+        psi[:,t] = scores.argmax(axis=1)
+        delta = scores.max(axis=1) + log_B[:,indices[:,t]].T
+    paths = np.empty((n_sequences,n_samples),dtype=np.intp)
+    paths[:,-1] = delta.argmax(axis=1)
+    rows = np.arange(n_sequences)
+    for t in xrange(n_samples - 1,0,-1):
+        paths[:,t - 1] = psi[rows,t,paths[:,t]]
+    log_probs = delta.max(axis=1)
+    if single:
+        return paths[0], log_probs[0]
+    return paths, log_probs
+
+def baum_welch(hmm, sequences, n_iter=20, update_Pi=True, update_A=True,
+        update_B=True, tol=0.0, processes=None, verbose=False):
+    '''
+    Trains the HMM in place with the Baum-Welch algorithm on a list of
+    observation sequences, which may have different lengths. Sequences of
+    equal length are processed together as one batch. Training stops after
+    n_iter iterations or when the total log likelihood changes by no more
+    than tol.
+
+    With processes > 1, the expected counts are computed in a pool of worker
+    processes, each of which receives its share of the sequences once, and
+    are summed before each update. Returns the HMM and the list of log
+    likelihoods of each iteration.
+    '''
+    batches = _get_batches(hmm,sequences)
+    if processes and processes > 1:
+        chunks = _split_batches(batches,processes)
+        pool = multiprocessing.Pool(len(chunks),_init_worker,(chunks,))
+    else:
+        pool = None
+    log_likelihoods = []
+    try:
+        for iteration in xrange(n_iter):
+            start = time.time()
+            if pool is not None:
+                parameters = (hmm.N,hmm.V,hmm.A,hmm.B,hmm.Pi)
+                stats = _sum_expected_counts(pool.map(_get_chunk_counts,
+                        [(i,parameters) for i in range(len(chunks))]))
+            else:
+                stats = _get_expected_counts(hmm,batches)
+            _update_parameters(hmm,stats,update_Pi,update_A,update_B)
+            log_likelihoods.append(stats['log_likelihood'])
+            if verbose:
+                print "Finished iteration %d in %.2f secs" % (iteration + 1,
+                        time.time() - start), stats['log_likelihood']
+            if (len(log_likelihoods) > 1 and
+                    abs(log_likelihoods[-1] - log_likelihoods[-2]) <= tol):
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return hmm, log_likelihoods
+
+def _get_symbol_lookup(V):
+    '''
+    Returns a function mapping an array of symbols to their indices in V.
+    Small ranges of integer symbols use a dense lookup array; other symbols
+    are found by binary search in the sorted symbols.
+    '''
+    if V.dtype.kind in 'iu' and len(V) > 0 and V.max() - V.min() < 2 ** 16:
+        offset = V.min()
+        table = np.full(V.max() - offset + 1,-1,dtype=np.intp)
+        table[V - offset] = np.arange(len(V))
+        def lookup(observations):
+            positions = observations.astype(np.intp) - offset
+            valid = ((positions >= 0) & (positions < len(table)) &
+                     (observations == np.round(observations)))
+            indices = np.full(observations.shape,-1,dtype=np.intp)
+            indices[valid] = table[positions[valid]]
+            if (indices < 0).any():
+                raise ValueError("unknown observation symbol")
+            return indices
+        return lookup
+    order = np.argsort(V,kind='mergesort')
+    sorted_V = V[order]
+    def lookup(observations):
+        positions = np.searchsorted(sorted_V,observations)
+        positions = np.minimum(positions,len(sorted_V) - 1)
+        if not (sorted_V[positions] == observations).all():
+            raise ValueError("unknown observation symbol")
+        return order[positions]
+    return lookup
+
+def _get_batch_indices(hmm, observations):
+    indices = hmm.get_symbol_indices(observations)
+    if indices.ndim == 1:
+        return indices[np.newaxis,:], True
+    return indices, False
+
+def _get_batches(hmm, sequences):
+    '''
+    Groups sequences by length and returns a list of (S,T) index arrays.
+    '''
+    by_length = {}
+    for sequence in sequences:
+        indices = hmm.get_symbol_indices(sequence)
+        by_length.setdefault(len(indices),[]).append(indices)
+    return [np.vstack(group) for _,group in sorted(by_length.items())]
+
+def _split_batches(batches, n_chunks):
+    '''
+    Splits the rows of each batch into at most n_chunks lists of batches.
+    '''
+    chunks = [[] for _ in range(n_chunks)]
+    for indices in batches:
+        for i,rows in enumerate(np.array_split(indices,n_chunks)):
+            if len(rows):
+                chunks[i].append(rows)
+    return [chunk for chunk in chunks if chunk]
+
+def _init_worker(chunks):
+    global _batches
+    _batches = chunks
+
+def _get_chunk_counts(job):
+    i,(n_states,V,A,B,Pi) = job
+    return _get_expected_counts(DiscreteHMM(n_states,V,A,B,Pi),_batches[i])
+
+def _sum_expected_counts(results):
+    stats = results[0]
+    for chunk_stats in results[1:]:
+        for key in stats:
+            stats[key] = stats[key] + chunk_stats[key]
+    return stats
+
+def _forward(hmm, indices):
+    n_sequences, n_samples = indices.shape
+    emissions = hmm.B.T[indices]
+    alpha = np.empty((n_sequences,n_samples,hmm.N))
+    scales = np.empty((n_sequences,n_samples))
+    alpha_t = hmm.Pi * emissions[:,0]
+    for t in xrange(n_samples):
+        if t > 0:
+            alpha_t = np.dot(alpha_t,hmm.A) * emissions[:,t]
+        scales[:,t] = alpha_t.sum(axis=1)
+        alpha_t = alpha_t / scales[:,t,np.newaxis]
+        alpha[:,t] = alpha_t
+    return alpha, scales
+
+def _backward(hmm, indices, scales):
+    n_sequences, n_samples = indices.shape
+    emissions = hmm.B.T[indices]
+    beta = np.empty((n_sequences,n_samples,hmm.N))
+    beta[:,-1] = 1.0
+    for t in xrange(n_samples - 2,-1,-1):
+        beta[:,t] = (np.dot(emissions[:,t + 1] * beta[:,t + 1],hmm.A.T) /
+                     scales[:,t + 1,np.newaxis])
+    return beta
+
+def _get_expected_counts(hmm, batches):
+    '''
+    Runs the E-step over batches of sequences and returns a dict of expected
+    initial state, transition and emission counts and the log likelihood.
+    '''
+    stats = {'start': np.zeros(hmm.N),
+             'trans': np.zeros((hmm.N,hmm.N)),
+             'emit': np.zeros((hmm.N,hmm.M)),
+             'log_likelihood': 0.0}
+    for indices in batches:
+        alpha, scales = _forward(hmm,indices)
+        beta = _backward(hmm,indices,scales)
+        gamma = alpha * beta
+        stats['log_likelihood'] += np.log(scales).sum()
+        stats['start'] += gamma[:,0].sum(axis=0)
+        if indices.shape[1] > 1:
+            emissions = hmm.B.T[indices[:,1:]]
+            weighted = emissions * beta[:,1:] / scales[:,1:,np.newaxis]
+            stats['trans'] += hmm.A * np.einsum('sti,stj->ij',alpha[:,:-1],
+                                                weighted)
+        flat_indices = indices.ravel()
+        flat_gamma = gamma.reshape(-1,hmm.N)
+        for i in xrange(hmm.N):
+            stats['emit'][i] += np.bincount(flat_indices,
+                    weights=flat_gamma[:,i],minlength=hmm.M)
+    return stats
+
+def _update_parameters(hmm, stats, update_Pi, update_A, update_B):
+    if update_Pi:
+        hmm.Pi = stats['start'] / stats['start'].sum()
+    if update_A:
+        totals = stats['trans'].sum(axis=1)[:,np.newaxis]
+        hmm.A = np.where(totals > 0,stats['trans'] / np.maximum(totals,1e-300),
+                         hmm.A)
+    if update_B:
+        totals = stats['emit'].sum(axis=1)[:,np.newaxis]
+        hmm.B = np.where(totals > 0,stats['emit'] / np.maximum(totals,1e-300),
+                         hmm.B)
+        for i in hmm.F:
+            hmm.B[i,:] = hmm.F[i]
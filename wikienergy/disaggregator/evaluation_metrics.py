@@ -39,19 +39,19 @@ def fraction_energy_assigned_correctly(predicted_power_as_instances, ground_trut
     traces_predicted = predicted_power_as_instances.traces
     #traces_predicted_power = [t.series for t in traces_predicted]
     total_energy_ground_truth = np.sum([float(np.sum(t.series)) for t in traces_truth])
-    percent_power_by_app = np.array([])
+    energy_assigned_correctly = []
     for trace_index in range(len(traces_predicted)):
         app_energy_predicted = np.sum(traces_predicted[trace_index].series)
         if traces_truth[trace_index].series.name==traces_predicted[trace_index].series.name:
-            app_energy_ground_truth = np.sum(traces_truth[trace_index])
+            app_energy_ground_truth = np.sum(traces_truth[trace_index].series)
         else:
             index = get_index(predicted_power_as_instances,traces_predicted[trace_index].series.name)
             if index!=-1:
-                app_energy_ground_truth = np.sum(traces_truth[index])
+                app_energy_ground_truth = np.sum(traces_truth[index].series)
             else:
                 app_energy_ground_truth = sys.maxint
-        percent_power_by_app = np.append(percent_power_by_app,float(np.min([app_energy_predicted,app_energy_ground_truth])))
-    return np.divide(float(np.sum(percent_power_by_app)),float(total_energy_ground_truth))
+        energy_assigned_correctly.append(float(np.min([app_energy_predicted,app_energy_ground_truth])))
+    return np.divide(float(np.sum(energy_assigned_correctly)),float(total_energy_ground_truth))
 
 def rss(truth,prediction):
     '''Sum of squared residuals'''
@@ -63,37 +63,73 @@ def guess_truth_from_power(signals,threshold):
     Given a series of power readings returns a numpy array where x[i]=0
     if signals[i] < threshold and x[i]=1 if signals[i] >= threshold
     '''
-    return np.array([1 if i>=threshold else 0 for i in signals])
+    return (np.asarray(signals) >= threshold).astype(int)
 
 def get_positive_negative_stats(true_states, predicted_states):
     '''
     Returns a dictionary of numpy arrays containing the true positives a 'tp',
     the false negatives as 'fn', the true negatives as 'tn', and
-    the false positives as 'fp'. I would like
-    to make this a truth table instead of putting the logic directly in the
-    list comprehension.
+    the false positives as 'fp'. States are 1 when on and 0 when off. Use
+    get_confusion_counts when only the totals are needed.
     '''
-    pos_neg_stats={}
-    pos_neg_stats['tp'] = np.array([a and b for (a,b) in zip(true_states,predicted_states)])
-    pos_neg_stats['fn'] = np.array([1 if a==1 and b==0 else 0 for (a,b) in zip(true_states,predicted_states)])
-    pos_neg_stats['tn'] = np.array([1 if a==0 and b==0 else 0 for (a,b) in zip(true_states,predicted_states)])
-    pos_neg_stats['fp'] = np.array([1 if a==0 and b==1 else 0 for (a,b) in zip(true_states,predicted_states)])
-    return pos_neg_stats
+    return _get_confusion_arrays(true_states,predicted_states,0)
 
 def get_positive_negative_stats_neg(true_states, predicted_states):
     '''
-        Returns a dictionary of numpy arrays containing the true positives a 'tp',
-        the false negatives as 'fn', the true negatives as 'tn', and
-        the false positives as 'fp'. I would like
-        to make this a truth table instead of putting the logic directly in the
-        list comprehension.
-        '''
-    pos_neg_stats={}
-    pos_neg_stats['tp'] = np.array([1 if a==1 and b==1 else 0 for (a,b) in zip(true_states,predicted_states)])
-    pos_neg_stats['fn'] = np.array([1 if a==1 and b==-1 else 0 for (a,b) in zip(true_states,predicted_states)])
-    pos_neg_stats['tn'] = np.array([1 if a==-1 and b==-1 else 0 for (a,b) in zip(true_states,predicted_states)])
-    pos_neg_stats['fp'] = np.array([1 if a==-1 and b==1 else 0 for (a,b) in zip(true_states,predicted_states)])
-    return pos_neg_stats
+    Returns a dictionary of numpy arrays containing the true positives a 'tp',
+    the false negatives as 'fn', the true negatives as 'tn', and
+    the false positives as 'fp'. States are 1 when on and -1 when off.
+    '''
+    return _get_confusion_arrays(true_states,predicted_states,-1)
+
+def get_confusion_counts(true_states, predicted_states, negative=0):
+    '''
+    Returns a dictionary with the number of true positives as 'tp', false
+    negatives as 'fn', true negatives as 'tn' and false positives as 'fp'.
+    States are 1 when on and equal to negative when off. The dictionary can
+    be passed to the metrics below in place of the full stats arrays.
+    '''
+    true_states = np.asarray(true_states)
+    predicted_states = np.asarray(predicted_states)
+    true_pos = true_states == 1
+    true_neg = true_states == negative
+    predicted_pos = predicted_states == 1
+    predicted_neg = predicted_states == negative
+    return {'tp': np.count_nonzero(true_pos & predicted_pos),
+            'fn': np.count_nonzero(true_pos & predicted_neg),
+            'tn': np.count_nonzero(true_neg & predicted_neg),
+            'fp': np.count_nonzero(true_neg & predicted_pos)}
+
+def get_confusion_counts_for_thresholds(true_states, power, thresholds):
+    '''
+    Returns a list with a dictionary of confusion counts for each threshold,
+    where a state is predicted to be on when power >= threshold and true
+    states are 1 when on and 0 when off. The power readings are sorted once
+    and every threshold is scored with a binary search.
+    '''
+    true_states = np.asarray(true_states)
+    power = np.asarray(power,dtype=np.float64)
+    thresholds = np.asarray(thresholds,dtype=np.float64)
+    pos_power = np.sort(power[true_states == 1])
+    neg_power = np.sort(power[true_states == 0])
+    tp = len(pos_power) - np.searchsorted(pos_power,thresholds,side='left')
+    fp = len(neg_power) - np.searchsorted(neg_power,thresholds,side='left')
+    return [{'tp': int(tp_i),
+             'fn': len(pos_power) - int(tp_i),
+             'tn': len(neg_power) - int(fp_i),
+             'fp': int(fp_i)} for tp_i,fp_i in zip(tp,fp)]
+
+def _get_confusion_arrays(true_states, predicted_states, negative):
+    true_states = np.asarray(true_states)
+    predicted_states = np.asarray(predicted_states)
+    true_pos = true_states == 1
+    true_neg = true_states == negative
+    predicted_pos = predicted_states == 1
+    predicted_neg = predicted_states == negative
+    return {'tp': (true_pos & predicted_pos).astype(int),
+            'fn': (true_pos & predicted_neg).astype(int),
+            'tn': (true_neg & predicted_neg).astype(int),
+            'fp': (true_neg & predicted_pos).astype(int)}
 
 def get_sensitivity(true_positives,false_negatives):
     '''
@@ -103,8 +139,8 @@ def get_sensitivity(true_positives,false_negatives):
     classified as positive and 0 otherwise and FN is false negative, such that
     FN = 1 if a value was falsely predicted to be negative and 0 otherwise.
     '''
-    if(true_positives.sum()+false_negatives.sum()>0):
-        return float(true_positives.sum())/(true_positives.sum()+false_negatives.sum())
+    if(np.sum(true_positives)+np.sum(false_negatives)>0):
+        return float(np.sum(true_positives))/(np.sum(true_positives)+np.sum(false_negatives))
     else:
        #print 'WARNING: There are no positives in this set. Returning 0.'
         return float(0.0)
@@ -118,7 +154,10 @@ def get_specificity(true_negatives, false_positives):
     positive, such that FP = 1 if a value was falsely predicted to be positive
     and 0 otherwise.
     '''
-    return float(true_negatives.sum())/(true_negatives.sum()+false_positives.sum())
+    if(np.sum(true_negatives)+np.sum(false_positives)>0):
+        return float(np.sum(true_negatives))/(np.sum(true_negatives)+np.sum(false_positives))
+    else:
+        return float(0.0)
 
 def get_precision(true_positives,false_positives):
     '''Given a numpy array of true positives, and false positives returns a
@@ -128,8 +167,8 @@ def get_precision(true_positives,false_positives):
     that FP = 1 if a value was falsely predicted to be positive and 0
     otherwise.
     '''
-    if(true_positives.sum()+false_positives.sum()>0):
-        return float(true_positives.sum())/(true_positives.sum()+false_positives.sum())
+    if(np.sum(true_positives)+np.sum(false_positives)>0):
+        return float(np.sum(true_positives))/(np.sum(true_positives)+np.sum(false_positives))
     else:
        #print 'WARNING: There are no positives in this set. Returning 0.'
         return float(0.0)
@@ -137,13 +176,13 @@ def get_precision(true_positives,false_positives):
 
 def get_accuracy(stats):
     '''
-        Takes an array of true positives, false negatives, true negatives, and false positives. Returns the Accuracy measure where accuracy is tp+tn/(tn+fn+tp+fp)
+        Takes arrays or counts of true positives, false negatives, true negatives, and false positives. Returns the Accuracy measure where accuracy is tp+tn/(tn+fn+tp+fp)
     '''
-    return (sum(stats['tp'])+sum(stats['tn']))/float(sum([sum(i) for i in stats.values()]))
+    return (np.sum(stats['tp'])+np.sum(stats['tn']))/float(sum([np.sum(i) for i in stats.values()]))
 
 def get_table_of_confusion(stats):
-    row_one = ["Positive",stats['tp'].sum(),stats['fp'].sum()]
-    row_two = ["Negative", stats['fn'].sum(), stats['tn'].sum()]
+    row_one = ["Positive",np.sum(stats['tp']),np.sum(stats['fp'])]
+    row_two = ["Negative", np.sum(stats['fn']), np.sum(stats['tn'])]
     headers = ["Positive","Negative"]
     table = [row_one,row_two]
     return tabulate(table,headers,tablefmt = "grid")
@@ -151,7 +190,7 @@ def get_table_of_confusion(stats):
 
 def get_f1_score(stats):
     '''
-        Takes an array of true positives, false negatives, true negatives, and false positives. Returns the f1 score based on precision and recall.
+        Takes arrays or counts of true positives, false negatives, true negatives, and false positives. Returns the f1 score based on precision and recall.
     '''
     precision=get_precision(stats['tp'],stats['fp'])
     recall=get_sensitivity(stats['tp'],stats['fn'])
@@ -160,3 +199,105 @@ def get_f1_score(stats):
     else:
        #print 'WARNING: The precision and recall are both 0. Returning 0.'
         return float(0.0)
+
+class MetricsAccumulator(object):
+    """This class accumulates evaluation metrics over chunks of truth and
+    prediction arrays, such as one day or one house at a time, so that long
+    runs can be scored in constant memory. Accumulators built by separate
+    workers can be combined with merge.
+    """
+
+    def __init__(self):
+        '''
+        Initializes an empty accumulator.
+        '''
+        self.counts = {'tp':0,'fn':0,'tn':0,'fp':0}
+        self.rss = 0.0
+        self.truth_sum = 0.0
+        self.prediction_sum = 0.0
+        self.truth_energy = {}
+        self.predicted_energy = {}
+
+    def update(self, truth, prediction, true_states=None,
+            predicted_states=None, appliance=None, negative=0):
+        '''
+        Adds a chunk of truth and prediction power values. If on/off states
+        are given, the confusion counts are updated as well. If an appliance
+        name is given, the energy totals of that appliance are updated for
+        the fraction of energy assigned correctly.
+        '''
+        truth = np.asarray(truth,dtype=np.float64)
+        prediction = np.asarray(prediction,dtype=np.float64)
+        self.rss += rss(truth,prediction)
+        truth_sum = truth.sum()
+        prediction_sum = prediction.sum()
+        self.truth_sum += truth_sum
+        self.prediction_sum += prediction_sum
+        if appliance is not None:
+            self.truth_energy[appliance] = (
+                    self.truth_energy.get(appliance,0.0) + truth_sum)
+            self.predicted_energy[appliance] = (
+                    self.predicted_energy.get(appliance,0.0) + prediction_sum)
+        if true_states is not None and predicted_states is not None:
+            counts = get_confusion_counts(true_states,predicted_states,
+                                          negative)
+            for key in self.counts:
+                self.counts[key] += counts[key]
+        return self
+
+    def merge(self, other):
+        '''
+        Adds the totals of another accumulator to this one.
+        '''
+        for key in self.counts:
+            self.counts[key] += other.counts[key]
+        self.rss += other.rss
+        self.truth_sum += other.truth_sum
+        self.prediction_sum += other.prediction_sum
+        for appliance in other.truth_energy:
+            self.truth_energy[appliance] = (
+                    self.truth_energy.get(appliance,0.0) +
+                    other.truth_energy[appliance])
+            self.predicted_energy[appliance] = (
+                    self.predicted_energy.get(appliance,0.0) +
+                    other.predicted_energy[appliance])
+        return self
+
+    def get_sum_error(self):
+        '''
+        Returns the absolute difference between the truth and prediction sums.
+        '''
+        return math.fabs(self.truth_sum - self.prediction_sum)
+
+    def get_fraction_energy_assigned_correctly(self):
+        '''
+        Returns the fraction of the total true energy of the appliances which
+        was assigned to the correct appliance.
+        '''
+        total_energy = sum(self.truth_energy.values())
+        if total_energy == 0:
+            return float(0.0)
+        assigned = sum(min(self.predicted_energy[appliance],
+                           self.truth_energy[appliance])
+                       for appliance in self.truth_energy)
+        return assigned/float(total_energy)
+
+    def report(self):
+        '''
+        Returns a dictionary of all accumulated metrics.
+        '''
+        counts = self.counts
+        report = {'rss': self.rss,
+                  'sum_error': self.get_sum_error(),
+                  'fraction_energy_assigned_correctly':
+                      self.get_fraction_energy_assigned_correctly(),
+                  'precision': get_precision(counts['tp'],counts['fp']),
+                  'sensitivity': get_sensitivity(counts['tp'],counts['fn']),
+                  'specificity': get_specificity(counts['tn'],counts['fp']),
+                  'f1_score': get_f1_score(counts)}
+        if sum(counts.values()) > 0:
+            report['accuracy'] = get_accuracy(counts)
+        else:
+            report['accuracy'] = float(0.0)
+        report.update(counts)
+        return report
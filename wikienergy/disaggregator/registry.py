@@ -0,0 +1,208 @@
+"""
+.. module:: registry
+   :platform: Unix
+   :synopsis: Contains a compact on-disk registry of Gaussian HMM parameters,
+      which can be memory mapped and searched by metadata.
+
+.. moduleauthor:: Phil Ngo <ngo.phil@gmail.com>
+.. moduleauthor:: Miguel Perez <miguel.a.perez4@gmail.com>
+.. moduleauthor:: Stephen Suffian <stephen.suffian@gmail.com>
+.. moduleauthor:: Sabina Tomkins <sabina.tomkins@gmail.com>
+
+"""
+
+from sklearn import hmm
+import numpy as np
+from collections import OrderedDict
+import json
+import os
+import struct
+
+_magic = 'HMMREG1\n'
+_header_format = '<Q'
+
+class ModelRegistry(object):
+    """This class represents a file of Gaussian HMM parameters.
+
+    The file starts with a JSON index listing the metadata, shape and offset
+    of every model, followed by a single buffer of float64 values holding the
+    start probabilities, transition matrix, means and covariances of each
+    model in turn. Covariances are stored in the shape of the model's
+    covariance type. The buffer is memory mapped, and model objects are only
+    built when they are first requested.
+    """
+
+    def __init__(self, path, mmap=True):
+        '''
+        Opens the registry at path. With mmap=False, the parameters are read
+        into memory instead of being memory mapped.
+        '''
+        self.path = path
+        self.entries, data_offset = _read_header(path)
+        n_values = sum(_get_n_values(entry) for entry in self.entries)
+        if n_values == 0:
+            self.values = np.zeros(0)
+        elif mmap:
+            self.values = np.memmap(path,dtype='<f8',mode='r',
+                                    offset=data_offset,shape=(n_values,))
+        else:
+            with open(path,'rb') as f:
+                f.seek(data_offset)
+                self.values = np.fromfile(f,dtype='<f8',count=n_values)
+        self._models = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find(self, device=None, dataid=None, month=None, **criteria):
+        '''
+        Returns the positions of the models whose metadata match all of the
+        given values, in the order they were saved.
+        '''
+        for name, value in [('device',device),('dataid',dataid),
+                            ('month',month)]:
+            if value is not None:
+                criteria[name] = value
+        return [i for i,entry in enumerate(self.entries)
+                if all(entry['metadata'].get(name) == value
+                       for name,value in criteria.items())]
+
+    def get_metadata(self, i):
+        '''
+        Returns the metadata of the ith model.
+        '''
+        return self.entries[i]['metadata']
+
+    def get_parameters(self, i):
+        '''
+        Returns the start probabilities, transition matrix, means and
+        covariances of the ith model as read-only views of the registry
+        buffer. The covariances have the shape used by the model's
+        covariance type.
+        '''
+        entry = self.entries[i]
+        parameters = []
+        offset = entry['offset']
+        for shape in _get_shapes(entry):
+            size = int(np.prod(shape))
+            parameters.append(self.values[offset:offset + size].reshape(shape))
+            offset += size
+        return tuple(parameters)
+
+    def get_model(self, i):
+        '''
+        Returns the GaussianHMM of the ith model, building it on first use.
+        '''
+        if i not in self._models:
+            startprob, transmat, means, covars = [np.array(p) for p in
+                                                  self.get_parameters(i)]
+            model = hmm.GaussianHMM(startprob.size,
+                                    _get_covariance_type(self.entries[i]),
+                                    startprob,transmat)
+            model.means_ = means
+            model.covars_ = covars
+            self._models[i] = model
+        return self._models[i]
+
+    def get_models(self, device=None, dataid=None, month=None,
+            key_for_model_name='name', **criteria):
+        '''
+        Returns an OrderedDict of the models matching the given metadata,
+        keyed by the metadata value key_for_model_name, as returned by
+        fhmm.generate_HMMs_from_type. Only the matching models are built.
+        Raises a ValueError if two matching models share a key.
+        '''
+        models = OrderedDict()
+        for i in self.find(device,dataid,month,**criteria):
+            name = self.get_metadata(i).get(key_for_model_name)
+            if name in models:
+                raise ValueError("more than one model matches with {} {}"
+                                 .format(key_for_model_name,name))
+            models[name] = self.get_model(i)
+        return models
+
+def save_models(path, models, metadata=None, key_for_model_name='name',
+        append=False):
+    '''
+    Saves a dict of GaussianHMMs, such as the OrderedDict returned by
+    fhmm.generate_HMMs_from_type, to a registry file at path. Each model is
+    stored with the shared metadata dict and its key under
+    key_for_model_name, by which it can later be found. With append=True,
+    the models are added to those already in the registry, replacing any
+    saved model with exactly the same metadata, so that saving the same
+    models again does not duplicate them.
+    '''
+    new_entries = []
+    for name, model in models.items():
+        entry_metadata = dict(metadata or {})
+        entry_metadata[key_for_model_name] = name
+        n, d = np.shape(model.means_)
+        new_entries.append(({'metadata': entry_metadata, 'n_states': n,
+                             'n_features': d,
+                             'covariance_type': model.covariance_type},
+                            [model.startprob_,model.transmat_,model.means_,
+                             model._covars_]))
+    entries = []
+    arrays = []
+    offset = 0
+    if append and os.path.exists(path):
+        registry = ModelRegistry(path,mmap=False)
+        replaced = set(json.dumps(entry['metadata'],sort_keys=True,
+                                  default=_to_json)
+                       for entry,_ in new_entries)
+        for entry in registry.entries:
+            if json.dumps(entry['metadata'],sort_keys=True) in replaced:
+                continue
+            n_values = _get_n_values(entry)
+            arrays.append(registry.values[entry['offset']:
+                                          entry['offset'] + n_values])
+            entry = dict(entry,offset=offset)
+            offset += n_values
+            entries.append(entry)
+    for entry, parameters in new_entries:
+        entry['offset'] = offset
+        arrays.extend(np.ravel(p).astype('<f8') for p in parameters)
+        offset += _get_n_values(entry)
+        entries.append(entry)
+    header = json.dumps({'models': entries},default=_to_json)
+    padding = -(len(_magic) + struct.calcsize(_header_format) +
+                len(header)) % 8
+    header += ' ' * padding
+    temp_path = path + '.tmp'
+    with open(temp_path,'wb') as f:
+        f.write(_magic)
+        f.write(struct.pack(_header_format,len(header)))
+        f.write(header)
+        for array in arrays:
+            array.tofile(f)
+    os.rename(temp_path,path)
+
+def _read_header(path):
+    with open(path,'rb') as f:
+        if f.read(len(_magic)) != _magic:
+            raise ValueError("{} is not a model registry".format(path))
+        size = struct.calcsize(_header_format)
+        header_length, = struct.unpack(_header_format,f.read(size))
+        header = json.loads(f.read(header_length))
+    return header['models'], len(_magic) + size + header_length
+
+def _get_covariance_type(entry):
+    return entry.get('covariance_type','full')
+
+def _get_shapes(entry):
+    '''
+    Returns the shapes of the start probabilities, transition matrix, means
+    and covariances of a model.
+    '''
+    n, d = entry['n_states'], entry['n_features']
+    covars_shapes = {'full': (n,d,d), 'diag': (n,d), 'spherical': (n,),
+                     'tied': (d,d)}
+    return [(n,),(n,n),(n,d),covars_shapes[_get_covariance_type(entry)]]
+
+def _get_n_values(entry):
+    return sum(int(np.prod(shape)) for shape in _get_shapes(entry))
+
+def _to_json(value):
+    if isinstance(value,np.generic):
+        return value.item()
+    return str(value)
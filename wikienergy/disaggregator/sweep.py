@@ -0,0 +1,190 @@
+"""
+.. module:: sweep
+   :platform: Unix
+   :synopsis: Contains methods for evaluating grids of HMM priors against
+      observed traces.
+
+.. moduleauthor:: Phil Ngo <ngo.phil@gmail.com>
+.. moduleauthor:: Miguel Perez <miguel.a.perez4@gmail.com>
+.. moduleauthor:: Stephen Suffian <stephen.suffian@gmail.com>
+.. moduleauthor:: Sabina Tomkins <sabina.tomkins@gmail.com>
+
+"""
+
+import fhmm
+import utils
+import evaluation_metrics
+import numpy as np
+import hashlib
+import multiprocessing
+import os
+import pickle
+import time
+
+_observations = None
+
+def get_observation_arrays(instances,trace_index=0):
+    '''
+    Returns a list of (n,1) float arrays of the observed power of each
+    instance, taken from the trace at trace_index. The arrays are computed
+    once per sweep and reused for every grid point.
+    '''
+    return [utils.trace_series_to_numpy_array(instance.traces[trace_index].series)
+            for instance in instances]
+
+def get_two_state_prior_grid(pi_prior,a_prior,state1_means,state1_covs,
+        state0_mean=0,state0_cov=0.0001):
+    '''
+    Returns a list of (pi_prior,a_prior,mean_prior,cov_prior) tuples for a
+    two state HMM, one for each combination of on state mean and covariance.
+    The list is ordered by mean and then by covariance, so that errors for
+    the grid can be reshaped to (len(state1_means),len(state1_covs)).
+    '''
+    grid = []
+    for state1_mean in state1_means:
+        for state1_cov in state1_covs:
+            mean_prior = np.array([[state0_mean],[state1_mean]])
+            cov_prior = np.array([[[state0_cov]],[[state1_cov]]])
+            grid.append((pi_prior,a_prior,mean_prior,cov_prior))
+    return grid
+
+def get_model_error(model,observations,method='sample',random_state=None):
+    '''
+    Returns the mean over all observation arrays of the sum error between the
+    observed power and the power estimated from the model's predicted states
+    (see get_estimated_power).
+    '''
+    estimates = get_estimated_power(model,observations,method,random_state)
+    return get_estimate_error(observations,estimates)
+
+def get_estimated_power(model,observations,method='sample',random_state=None):
+    '''
+    Returns a list of the power estimated from the model's predicted states
+    for each observation array. With method='sample', the estimated power is
+    drawn from a normal distribution around each state mean; with
+    method='mean' it is the state mean.
+    '''
+    if method not in ['sample','mean']:
+        raise ValueError("method must be 'sample' or 'mean'")
+    if random_state is None:
+        random_state = np.random
+    means = np.ravel(model.means_)
+    scales = np.ravel(model.covars_)
+    estimates = []
+    for obs_power in observations:
+        est_states = model.predict(obs_power)
+        if method == 'sample':
+            est_power = random_state.normal(means[est_states],
+                                            scales[est_states])
+        else:
+            est_power = means[est_states]
+        estimates.append(est_power)
+    return estimates
+
+def get_estimate_error(observations,estimates):
+    '''
+    Returns the mean over all observation arrays of the sum error between the
+    observed and the estimated power.
+    '''
+    return np.mean([evaluation_metrics.sum_error(obs_power,est_power)
+                    for obs_power,est_power in zip(observations,estimates)])
+
+def evaluate_grid(observations,grid,method='sample',processes=None,seed=None,
+        checkpoint_path=None,checkpoint_every=10,verbose=False):
+    '''
+    Evaluates get_model_error for an HMM initialized from each set of priors
+    in grid, and returns an array of errors in the order of the grid.
+
+    With processes > 1, grid points are evaluated in a pool of worker
+    processes, each of which receives the observation arrays once. If a seed
+    is given, the ith grid point samples with the seed seed + i. If a
+    checkpoint_path is given, finished errors are pickled there every
+    checkpoint_every points, and a sweep restarted with the same grid and
+    checkpoint_path skips the points which are already done. A checkpoint
+    made with different observations, grid, method or seed raises a
+    ValueError instead of being reused.
+    '''
+    fingerprint = None
+    if checkpoint_path:
+        fingerprint = get_sweep_fingerprint(observations,grid,method,seed)
+    errors = _load_checkpoint(checkpoint_path,len(grid),fingerprint)
+    jobs = [(i,priors,method,None if seed is None else seed + i)
+            for i,priors in enumerate(grid) if i not in errors]
+    if verbose and errors:
+        print 'Resuming sweep with {} of {} points done'.format(len(errors),
+                len(grid))
+    if processes and processes > 1:
+        pool = multiprocessing.Pool(processes,_init_worker,(observations,))
+        results = pool.imap_unordered(_evaluate_grid_point,jobs)
+    else:
+        pool = None
+        _init_worker(observations)
+        results = (_evaluate_grid_point(job) for job in jobs)
+    try:
+        for n_done,(i,error,duration) in enumerate(results,1):
+            errors[i] = error
+            if verbose:
+                print 'Point {} ({} of {}): error {:.4f} in {:.2f}s'.format(i,
+                        len(errors),len(grid),error,duration)
+            if checkpoint_path and n_done % checkpoint_every == 0:
+                _save_checkpoint(checkpoint_path,errors,len(grid),
+                                 fingerprint)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if checkpoint_path:
+            _save_checkpoint(checkpoint_path,errors,len(grid),fingerprint)
+    return np.array([errors[i] for i in range(len(grid))])
+
+def get_sweep_fingerprint(observations,grid,method='sample',seed=None):
+    '''
+    Returns a hash of the observation arrays, the priors of every grid
+    point, the method and the seed of a sweep, which identifies the
+    sweep a checkpoint belongs to.
+    '''
+    sha = hashlib.sha1()
+    sha.update(repr((method,seed,len(observations),len(grid))))
+    for array in observations:
+        _update_hash(sha,array)
+    for priors in grid:
+        for array in priors:
+            _update_hash(sha,array)
+    return sha.hexdigest()
+
+def _update_hash(sha,array):
+    array = np.ascontiguousarray(array,dtype=np.float64)
+    sha.update(repr(array.shape))
+    sha.update(array.tostring())
+
+def _init_worker(observations):
+    global _observations
+    _observations = observations
+
+def _evaluate_grid_point(job):
+    i,(pi_prior,a_prior,mean_prior,cov_prior),method,seed = job
+    start = time.time()
+    model = fhmm.init_HMM(pi_prior,a_prior,mean_prior,cov_prior)
+    random_state = np.random.RandomState(seed)
+    error = get_model_error(model,_observations,method,random_state)
+    return i,error,time.time() - start
+
+def _load_checkpoint(checkpoint_path,n_points,fingerprint):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return {}
+    with open(checkpoint_path,'rb') as f:
+        checkpoint = pickle.load(f)
+    if checkpoint['n_points'] != n_points:
+        raise ValueError("checkpoint at {} is for a grid of {} points, not {}"
+                .format(checkpoint_path,checkpoint['n_points'],n_points))
+    if checkpoint.get('fingerprint') != fingerprint:
+        raise ValueError("checkpoint at {} is for a different sweep"
+                .format(checkpoint_path))
+    return checkpoint['errors']
+
+def _save_checkpoint(checkpoint_path,errors,n_points,fingerprint):
+    temp_path = checkpoint_path + '.tmp'
+    with open(temp_path,'wb') as f:
+        pickle.dump({'n_points':n_points,'fingerprint':fingerprint,
+                     'errors':errors},f)
+    os.rename(temp_path,checkpoint_path)
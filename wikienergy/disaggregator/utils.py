@@ -21,45 +21,144 @@ import decimal
 import datetime
 import random
 import copy
+import time
+import collections
+import warnings
+from multiprocessing.pool import ThreadPool
 
 
-def aggregate_instances(instances, metadata, how="strict"):
+def aggregate_instances(instances, metadata, how="strict", weights=None,
+                        chunk_size=None):
     '''
     Given a list of temporally aligned instances, aggregate them into a single
-    signal.
+    signal. Weights and chunk_size are passed on to `aggregate_traces`.
     '''
     if how == "strict":
         if not instances_aligned(instances):
             raise appliance.AlignmentError
-        traces = [instance.traces for instance in instances]
-        traces = [list(t) for t in zip(*traces)] # transpose
-        traces = [ aggregate_traces(t,{}) for t in traces]
+        traces = zip(*[instance.traces for instance in instances])
+        traces = [aggregate_traces(t,{},how,weights,chunk_size,
+                                   check_aligned=False) for t in traces]
         return appliance.ApplianceInstance(traces, metadata)
     else:
-        return NotImplementedError
+        raise NotImplementedError
 
-def aggregate_traces(traces, metadata, how="strict"):
+def aggregate_traces(traces, metadata, how="strict", weights=None,
+                     chunk_size=None, check_aligned=True):
     '''
     Given a list of temporally aligned traces, aggregate them into a single
-    signal.
+    signal. The trace values are stacked and summed into a new array, with
+    each trace multiplied by its weight if weights are given. With a
+    chunk_size, at most chunk_size traces are stacked at a time.
     '''
     if how == "strict":
-        if not traces_aligned(traces):
+        if check_aligned and not traces_aligned(traces):
             raise appliance.AlignmentError
-        summed_series = traces[0].series
-        for trace in traces[1:]:
-            summed_series += trace.series
+        if weights is not None:
+            weights = np.asarray(weights,dtype=np.float64)
+            if len(weights) != len(traces):
+                raise ValueError("need one weight per trace")
+        if chunk_size is None:
+            chunk_size = len(traces)
+        index = traces[0].series.index
+        total = np.zeros(len(index))
+        for start in range(0,len(traces),chunk_size):
+            chunk = traces[start:start + chunk_size]
+            # traces are summed as float64, with int64 fixed-point and
+            # decimal traces converted to their float values
+            stack = np.empty((len(chunk),len(index)))
+            for i,trace in enumerate(chunk):
+                stack[i] = convert_series_storage(trace.series).values
+            if weights is None:
+                total += np.sum(stack,axis=0)
+            else:
+                total += np.dot(weights[start:start + chunk_size],stack)
+        summed_series = pd.Series(total,index=index,
+                                  name=traces[0].series.name)
         return appliance.ApplianceTrace(summed_series, metadata)
     else:
-        return NotImplementedError
+        raise NotImplementedError
 
-def bootstrap_appliance_set(appliance_sets, k, n, how="strict"):
+def bootstrap_appliance_set(appliance_sets, k, n, how="strict",
+                            metadata=None, random_state=None):
     """
     Returns a list of n bootstrapped appliance sets (each with k appliances).
     Fails if how="strict" and appliance sets are not aligned.
+
+    The instances of all appliance sets are stacked once into a shared
+    matrix (see `stack_appliance_sets`). Each bootstrapped set holds the
+    sampled instances and an index vector into that matrix, and only copies
+    its columns if its own matrix is requested. Use `get_bootstrap_indices`
+    and `get_bootstrap_totals` directly to get the aggregate signals of many
+    samples without building sets. The samples are drawn with random_state
+    (see `get_bootstrap_indices`).
     """
-    # TODO write this function.
-    pass
+    if metadata is None:
+        metadata = {'name': None, 'source': "bootstrap sample"}
+    matrix, instances = stack_appliance_sets(appliance_sets, how)
+    indices = get_bootstrap_indices(len(instances), k, n, random_state)
+    return [appliance.ApplianceSet([instances[i] for i in row],
+                                   dict.copy(metadata), validate=False,
+                                   matrix_source=(matrix, row))
+            for row in indices]
+
+def stack_appliance_sets(appliance_sets, how="strict"):
+    """
+    Returns a (time x instance) matrix of the first trace of every instance
+    in the appliance sets, and the list of those instances. With how="front",
+    the columns of misaligned traces are aligned with `align_traces`, while
+    the instances themselves are returned unchanged; with how="strict", an
+    AlignmentError is raised instead.
+    """
+    instances = [instance for appliance_set in appliance_sets
+                 for instance in appliance_set.instances]
+    traces = [instance.traces[0] for instance in instances]
+    if not traces_aligned(traces):
+        if how == "strict":
+            raise appliance.AlignmentError
+        elif how == "front":
+            traces = align_traces(traces, how=how)
+            matrix = np.empty((len(traces[0].series), len(traces)), order='F')
+            for i, trace in enumerate(traces):
+                matrix[:, i] = convert_series_storage(trace.series).values
+            return matrix, instances
+        else:
+            raise NotImplementedError
+    matrix = np.empty((len(traces[0].series), len(instances)), order='F')
+    start = 0
+    for appliance_set in appliance_sets:
+        set_matrix = appliance_set.get_matrix()
+        matrix[:, start:start + set_matrix.shape[1]] = set_matrix
+        start += set_matrix.shape[1]
+    return matrix, instances
+
+def get_bootstrap_indices(n_instances, k, n, random_state=None):
+    """
+    Returns an (n, k) array of instance indices sampled with replacement.
+    random_state may be a seed or a numpy RandomState; by default the global
+    numpy random state is used.
+    """
+    if random_state is None:
+        random_state = np.random
+    elif not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+    return random_state.randint(0, n_instances, size=(n, k))
+
+def get_bootstrap_totals(matrix, indices, chunk_size=None):
+    """
+    Returns an (n, time) array of the summed usage of each bootstrapped
+    sample, given a (time x instance) matrix and an (n, k) array of instance
+    indices. The columns of each sample are gathered and summed at once;
+    with a chunk_size, at most chunk_size samples are gathered at a time to
+    bound the (time x chunk_size x k) temporary.
+    """
+    if chunk_size is None:
+        chunk_size = max(len(indices), 1)
+    totals = np.empty((len(indices), matrix.shape[0]))
+    for start in range(0, len(indices), chunk_size):
+        chunk = indices[start:start + chunk_size]
+        totals[start:start + chunk_size] = matrix[:, chunk].sum(axis=-1).T
+    return totals
 
 def create_datetimeindex(df):
     """
@@ -120,6 +219,27 @@ def split_trace_into_rate(trace,rate):
         traces.append(appliance.ApplianceTrace(group[1],metadata))
     return traces
 
+def get_split_boundaries(index, rate):
+    '''
+    Returns an array of the positions at which a DatetimeIndex starts a new
+    day ('D'), week starting on Monday ('W') or month ('M'), starting with 0
+    and ending with the length of the index, so that consecutive pairs give
+    the bounds of each split.
+    '''
+    if rate == 'D' or rate == '1D':
+        freq = 'D'
+    elif rate == 'W' or rate == '1W':
+        freq = 'W-MON'
+    elif rate == 'M' or rate == '1M':
+        freq = 'MS'
+    else:
+        raise NotImplementedError('Looking for "week" or "day"')
+    if len(index) == 0:
+        return np.array([0])
+    edges = pd.date_range(index[0].normalize(), index[-1], freq=freq)
+    cuts = index.searchsorted(edges)
+    return np.unique(np.concatenate([[0], cuts, [len(index)]]))
+
 def split_instance_traces_into_rate(device_instance,rate):
     '''
     Each trace in an instance is split into multiple traces that are each
@@ -213,13 +333,154 @@ def resample_trace(trace,sample_rate):
     try:
         new_series=trace.series.astype(float)
         new_series=new_series.resample(sample_rate,how='mean')
-        new_series=new_series.map(decimal.Decimal)
         new_series.name=trace.series.name
         return appliance.ApplianceTrace(new_series,trace.metadata)
     except ValueError:
         raise SampleError(self.sample_rate)
 
 
+def convert_series_storage(series, storage='float64', scale=1000):
+    '''
+    Returns the series with its values held in the given storage mode:
+
+    * 'float64' - native floats (default). Returned as is if already float64.
+    * 'int64' - fixed-point integers in units of 1/scale (e.g. scale=1000
+      stores milliwatts for a series in watts), for exact accounting. NaNs
+      are stored as zero.
+    * 'decimal' - an object series of decimal.Decimal values. This is slow
+      and should only be requested explicitly.
+
+    An int64 series is taken to be in fixed-point storage already, so it is
+    returned as is for 'int64' and divided by scale for the other modes.
+    '''
+    if storage == 'int64' and series.dtype == np.int64:
+        return series
+    if storage == 'float64':
+        if series.dtype == np.float64:
+            return series
+        return _get_float_series(series, scale)
+    elif storage == 'int64':
+        values = np.nan_to_num(series.astype(np.float64).values) * scale
+        return pd.Series(np.round(values).astype(np.int64),
+                         index=series.index, name=series.name)
+    elif storage == 'decimal':
+        return _get_float_series(series, scale).map(decimal.Decimal)
+    else:
+        raise ValueError("Unknown storage mode: {}".format(storage))
+
+def _get_float_series(series, scale=1000):
+    '''
+    Returns the series as float64, undoing the fixed-point scale of an int64
+    series.
+    '''
+    if series.dtype == np.int64:
+        return series / float(scale)
+    return series.astype(np.float64)
+
+def resample_traces(traces, sample_rate, method='mean', storage='float64'):
+    '''
+    Returns a list of new traces resampled to a given sample rate, defined by
+    the offset aliases described in panda time series, using the given
+    method. Empty bins are filled with zeroes.
+
+    Traces which are regularly sampled, naive or in UTC, whose sampling
+    period divides the new one and whose first reading falls on a bin edge
+    are stacked by start and length into 2-D arrays and reduced with a single
+    reshape when the method is 'mean', 'sum' or 'max'. Other traces are
+    resampled with pandas.
+    '''
+    offset = pd.tseries.frequencies.to_offset(sample_rate)
+    new_traces = [None] * len(traces)
+    groups = collections.OrderedDict()
+    for i, trace in enumerate(traces):
+        factor = None
+        if method in _bin_reducers:
+            factor = _get_resample_factor(trace.series.index, offset)
+        if factor is None:
+            new_traces[i] = _resample_trace_with_pandas(trace, sample_rate,
+                                                        method, storage)
+        else:
+            index = trace.series.index
+            groups.setdefault((index[0], factor, len(index)), []).append(i)
+    for (start, factor, length), indices in groups.items():
+        n_bins = -(-length // factor)
+        values = np.full((len(indices), n_bins * factor), np.nan)
+        for row, i in enumerate(indices):
+            values[row, :length] = convert_series_storage(
+                traces[i].series).values
+        values = values.reshape(len(indices), n_bins, factor)
+        reducer, nan_reducer = _bin_reducers[method]
+        if length % factor == 0 and not np.isnan(values).any():
+            reduced = reducer(values, axis=2)
+        else:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                reduced = nan_reducer(values, axis=2)
+            reduced[np.isnan(reduced)] = 0
+        new_index = pd.date_range(start, periods=n_bins, freq=offset)
+        for row, i in enumerate(indices):
+            series = pd.Series(reduced[row], index=new_index,
+                               name=traces[i].series.name)
+            new_traces[i] = appliance.ApplianceTrace(
+                convert_series_storage(series, storage), traces[i].metadata)
+    return new_traces
+
+def resample_instances(instances, sample_rate, method='mean',
+                       storage='float64', split_by=None):
+    '''
+    Returns a list of new instances with all of their traces resampled in a
+    single call to `resample_traces`. If split_by is given, each resampled
+    trace is also split by that rate ('D', 'W' or 'M') in the same pass.
+    '''
+    traces = [trace for instance in instances for trace in instance.traces]
+    new_traces = resample_traces(traces, sample_rate, method, storage)
+    new_instances = []
+    start = 0
+    for instance in instances:
+        instance_traces = new_traces[start:start + len(instance.traces)]
+        start += len(instance.traces)
+        if split_by is not None:
+            instance_traces = [split_trace for trace in instance_traces
+                               for split_trace in trace.iter_split_by(split_by)]
+        new_instances.append(appliance.ApplianceInstance(instance_traces,
+                                                         instance.metadata,
+                                                         sort_traces=False))
+    return new_instances
+
+_bin_reducers = {'mean': (np.mean, np.nanmean),
+                 'sum': (np.sum, np.nansum),
+                 'max': (np.max, np.nanmax)}
+
+def _get_resample_factor(index, offset):
+    '''
+    Returns the number of readings per bin if the index can be resampled to
+    the offset by reshaping, and None otherwise.
+    '''
+    if not isinstance(index, pd.DatetimeIndex) or len(index) < 2:
+        return None
+    if not isinstance(offset, pd.tseries.offsets.Tick):
+        return None
+    if index.tz is not None and str(index.tz) != 'UTC':
+        return None
+    times = index.asi8
+    step = times[1] - times[0]
+    if step <= 0 or offset.nanos % step != 0:
+        return None
+    if index.freq is None and not (np.diff(times) == step).all():
+        return None
+    start = index[0]
+    if (start - start.normalize()).value % offset.nanos != 0:
+        return None
+    return offset.nanos // step
+
+def _resample_trace_with_pandas(trace, sample_rate, method, storage):
+    new_series = convert_series_storage(trace.series)
+    new_series = new_series.resample(sample_rate, how=method)
+    new_series = new_series.fillna(0)
+    new_series = convert_series_storage(new_series, storage)
+    new_series.name = trace.series.name
+    return appliance.ApplianceTrace(new_series, trace.metadata)
+
 def resample_instance_traces(device_instance,sample_rate):
     '''
     Resamples all traces within a given instance.
@@ -256,7 +517,7 @@ def order_traces(traces):
     Given a set of traces, orders them chronologically and catches
     overlapping traces.
     '''
-    order = np.argsort([t.series.index[0] for t in traces])
+    order = np.argsort([t.get_start_time() for t in traces])
     new_traces = [traces[i] for i in order]
     return new_traces
 
@@ -281,37 +542,91 @@ def generate_random_appliance_sets(appliance_sets,k,n):
     sets, whose instances have been sampled
     (w/replacement) from the instances of the given appliance_sets.
 
-    ApplianceSets must be aligned.
+    ApplianceSets must be aligned; misaligned traces are aligned to the front
+    of the shortest one.
     """
-    all_instances = [instance for appliance_set in appliance_sets
-                     for instance in appliance_set.instances]
-    n_instances = len(all_instances)
-    all_sets = []
-    for _ in xrange(n):
-        instances = []
-        for _ in xrange(k):
-            instance = all_instances[random.randrange(n_instances)]
-            instances.append(instance)
-        metadata = {'name': None, 'source': "random sample"}
-        appliance_set = appliance.ApplianceSet(instances, metadata)
-        all_sets.append(appliance_set)
-    return all_sets
-
-
-def trace_series_to_numpy_array(values):
-    '''
-    This takes the series from a trace and converts it to a numpy array for
-    ingestion into HMMs and certain plots. It also removes the NaNs.
-    '''
-    a=[]
-    X=[]
-    for i in values:
-        a.append(float(i))
-        X.append(a)
-        a=[]
-    array=np.array(X)
-    whereAreNaNs = np.isnan(array);
-    array[whereAreNaNs] = 0;
+    metadata = {'name': None, 'source': "random sample"}
+    return bootstrap_appliance_set(appliance_sets,k,n,how="front",
+                                   metadata=metadata)
+
+def parallel_map(func, items, executor=None, max_workers=None):
+    '''
+    Returns [func(item) for item in items], evaluated concurrently. executor
+    may be an existing pool (any object with a `map` method, such as a
+    multiprocessing.pool.ThreadPool) shared between calls; otherwise, if
+    max_workers is given, a thread pool with at most that many threads is
+    used for this call. With neither, items are processed sequentially.
+    '''
+    items = list(items)
+    if executor is not None:
+        return executor.map(func, items)
+    if max_workers and max_workers > 1 and len(items) > 1:
+        pool = ThreadPool(min(max_workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+    return [func(item) for item in items]
+
+def call_with_retries(func, args=(), n_retries=3, delay=1.0,
+                      exceptions=(Exception,)):
+    '''
+    Returns func(*args), retrying up to n_retries more times if one of the
+    given (transient) exceptions is raised, waiting delay seconds before the
+    first retry and doubling the wait after each failure.
+    '''
+    for attempt in range(n_retries + 1):
+        try:
+            return func(*args)
+        except exceptions:
+            if attempt == n_retries:
+                raise
+            time.sleep(delay * 2 ** attempt)
+
+def trace_series_to_numpy_array(values, nan_policy='zero', out=None):
+    '''
+    This takes the series from a trace and converts it to an (n,1) float
+    numpy array for ingestion into HMMs and certain plots. NaNs are handled
+    according to nan_policy:
+
+    * 'zero' - NaNs are replaced by 0 (default)
+    * 'ffill' - NaNs are replaced by the last valid value (0 before the first)
+    * 'interpolate' - NaNs are linearly interpolated between valid values
+    * 'mask' - a masked array is returned with the NaNs masked
+
+    When there are no NaNs to replace, the result is a view on the series
+    values and nothing is copied. If out is given, an (n,1) float64 array,
+    the values are written into it so that repeated calls can reuse memory.
+    '''
+    if nan_policy not in ['zero','ffill','interpolate','mask']:
+        raise NotImplementedError(
+            'Looking for "zero", "ffill", "interpolate" or "mask"')
+    array = np.asarray(values,dtype=np.float64).reshape(-1,1)
+    if out is not None:
+        np.copyto(out,array)
+        array = out
+    nans = np.isnan(array[:,0])
+    if nan_policy == 'mask':
+        return np.ma.array(array,mask=nans[:,np.newaxis])
+    if not nans.any():
+        return array
+    if out is None:
+        array = array.copy()
+    column = array[:,0]
+    if nan_policy == 'zero':
+        column[nans] = 0
+    elif nan_policy == 'ffill':
+        last_valid = np.where(nans,0,np.arange(column.size))
+        np.maximum.accumulate(last_valid,out=last_valid)
+        column[:] = column[last_valid]
+        column[np.isnan(column)] = 0
+    elif nan_policy == 'interpolate':
+        valid = np.flatnonzero(~nans)
+        if valid.size:
+            column[nans] = np.interp(np.flatnonzero(nans),valid,column[valid])
+        else:
+            column[:] = 0
     return array
 
 def get_trace_in_time_of_day(device_trace,start_time,end_time):
@@ -363,26 +678,87 @@ def get_trace_windows(trace,window_length,window_step):
     """
     print "WARNING: deprecated, "\
           "use trace.get_windows(window_length,window_step) instead"
-    total_length = trace.series.size
-    n_steps = int((total_length - window_length) / window_step)
-    windows = []
-    for step in range(n_steps):
-        start = step * window_step
-        window = trace.series[start:start + window_length].tolist()
-        windows.append(window)
-    return np.array(windows,dtype=np.float)
+    return get_window_view(trace.series.values,window_length,window_step)
+
+def get_window_view(values,window_length,window_step):
+    """
+    Returns a read-only (n_windows x window_length) array of sliding windows
+    over a 1-D array of values. The windows are a strided view on the float
+    buffer, so no data is copied unless the values are not already float64.
+    """
+    values = np.ascontiguousarray(values,dtype=np.float64)
+    n_steps = max(int((values.size - window_length) / window_step),0)
+    stride = values.strides[0]
+    windows = np.lib.stride_tricks.as_strided(values,
+            shape=(n_steps,window_length),
+            strides=(stride * window_step,stride))
+    windows.flags.writeable = False
+    return windows
+
+def get_window_reductions(values,window_length,window_step,how='sum'):
+    """
+    Returns a 1-D array with the sum, mean or max ('sum', 'mean', 'max') of
+    each sliding window, reduced directly over the strided view.
+    """
+    if how not in ['sum','mean','max']:
+        raise NotImplementedError('Looking for "sum", "mean" or "max"')
+    windows = get_window_view(values,window_length,window_step)
+    return getattr(windows,how)(axis=1)
+
+def iter_trace_windows(traces,window_length,window_step,batch_size=None):
+    """
+    Iterates over the sliding windows of many traces. Without a batch_size,
+    yields one read-only window view per trace. With a batch_size, yields
+    arrays of at most batch_size windows taken across consecutive traces, so
+    that only one batch is materialized at a time.
+    """
+    views = (get_window_view(trace.series.values,window_length,window_step)
+             for trace in traces)
+    if not batch_size:
+        for view in views:
+            yield view
+        return
+    pending = []
+    n_pending = 0
+    for view in views:
+        start = 0
+        while start < view.shape[0]:
+            stop = min(start + batch_size - n_pending,view.shape[0])
+            pending.append(view[start:stop])
+            n_pending += stop - start
+            start = stop
+            if n_pending == batch_size:
+                yield np.concatenate(pending,axis=0)
+                pending = []
+                n_pending = 0
+    if n_pending:
+        yield np.concatenate(pending,axis=0)
 
 def traces_aligned(traces):
     """
-    Returns True if traces are temporally aligned
+    Returns True if traces are temporally aligned, meaning that their indexes
+    share a start, frequency, length and timezone. Indexes without a
+    frequency are compared element by element.
     """
     indices = [trace.series.index for trace in traces]
     for index in indices[1:]:
-        if not indices[0].summary()==(index.summary()):
-            print index
+        if not _indexes_aligned(indices[0],index):
             return False
     return True
 
+def _indexes_aligned(index, other):
+    if index is other:
+        return True
+    if len(index) != len(other) or index.freq != other.freq:
+        return False
+    if len(index) == 0:
+        return True
+    if str(getattr(index,'tz',None)) != str(getattr(other,'tz',None)):
+        return False
+    if index.freq is None:
+        return np.array_equal(index.asi8,other.asi8)
+    return index[0] == other[0]
+
 def instances_aligned(instances):
     """
     Returns True iff instances and their traces are temporally aligned.
@@ -391,12 +767,10 @@ def instances_aligned(instances):
         return True
     for instance in instances[1:]:
         if not len(instance.traces) == len(instances[0].traces):
-            print "one"
             return False
     traces = map(list,zip(*[instance.traces for instance in instances]))
     for traces_ in traces:
         if not traces_aligned(traces_):
-            print "two"
             return False
     return True
 
@@ -405,19 +779,21 @@ def align_traces(traces,to=None,how="front",freq=None):
     Temporally aligns the traces. `how`="front" means to align to the front of
     the `to` trace. If no `to` trace is given, the first shortest trace is used.
     Traces are all downsampled to match the lowest sampling rate
-    """
-    # make copies
-
-    traces=copy.deepcopy(traces)
 
+    The traces are not copied: if the traces are already aligned, they are
+    returned as they are. Otherwise every trace is replaced by a new trace
+    whose series is a read-only view on the original values, sharing a
+    single shifted index, so that writing into it raises a ValueError
+    instead of changing the original trace. Copy the series before changing
+    it in place. Only traces at a different frequency are resampled.
+    """
     # if already aligned, don't do extra work.
     if traces_aligned(traces):
-        return traces
+        return list(traces)
 
     # resample to the same frequency
-
     if freq:
-        new_freq = freq
+        new_freq = pd.tseries.frequencies.to_offset(freq)
     else:
         frequencies = [pd.tseries.frequencies.to_offset(trace.series.index.freq)
                     for trace in traces if trace.series.index.freq]
@@ -425,9 +801,11 @@ def align_traces(traces,to=None,how="front",freq=None):
             new_freq = sorted(frequencies,reverse=True)[0]
         except IndexError:
             print "Please supply a frequency, no frequency could be guessed."
+            new_freq = None
 
-    for trace in traces:
-        trace.resample(new_freq)
+    if new_freq is not None:
+        traces = [trace if trace.series.index.freq == new_freq
+                  else trace.resample(new_freq) for trace in traces]
 
     # determine where to shift to and how much to cut off
     if not to:
@@ -435,24 +813,29 @@ def align_traces(traces,to=None,how="front",freq=None):
         to = traces[shortest_i]
         cutoff = to.series.size
     else:
-        all_traces = traces[:]
-        all_traces.append(to)
-        shortest_i = np.argsort([trace.series.size for trace in all_traces])[0]
-        cutoff = all_traces[shortest_i].series.size
+        cutoff = min([trace.series.size for trace in traces] +
+                     [to.series.size])
 
     # shift
-    if how == 'front':
-        offsets = [to.series.index[0] - trace.series.index[0] for trace in traces]
-        for trace,offset in zip(traces,offsets):
-            trace.series.index = trace.series.index + offset
-    else:
+    if how != 'front':
         raise NotImplementedError
+    start = to.series.index[0]
+    if new_freq is not None:
+        shared_index = pd.date_range(start,periods=cutoff,freq=new_freq)
 
     # cut off extra:
+    new_traces = []
     for trace in traces:
-        trace.series = trace.series[:cutoff]
-
-    return traces
+        if new_freq is not None:
+            index = shared_index
+        else:
+            offset = start - trace.series.index[0]
+            index = trace.series.index[:cutoff] + offset
+        values = trace.series.values[:cutoff].view()
+        values.flags.writeable = False
+        series = pd.Series(values,index=index,name=trace.series.name)
+        new_traces.append(appliance.ApplianceTrace(series,trace.metadata))
+    return new_traces
 
 def align_instances(instances):
     """
@@ -119,14 +119,7 @@ def get_train_valid_test_indices(n):
            indices[n_train+n_valid:])
 
 def trace_windows(trace,window_length,window_step):
-    total_length = trace.series.size
-    n_steps = int((total_length - window_length) / window_step)
-    windows = []
-    for step in range(n_steps):
-        start = step * window_step
-        window = trace.series[start:start + window_length].as_matrix()
-        windows.append(window)
-    return np.array(windows,dtype=np.float)
+    return trace.get_windows(window_length,window_step)
 
 def get_training_arrays(schema, table, ids, column, sample_rate,
         window_length, window_step,label):
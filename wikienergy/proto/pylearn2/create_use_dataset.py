@@ -55,14 +55,7 @@ tables = [u'validated_01_2014',
           u'validated_05_2014',]
 
 def trace_windows(trace,window_length,window_step):
-    total_length = trace.series.size
-    n_steps = int((total_length - window_length) / window_step)
-    windows = []
-    for step in range(n_steps):
-        start = step * window_step
-        window = trace.series[start:start + window_length].as_matrix()
-        windows.append(window)
-    return np.array(windows,dtype=np.float)
+    return trace.get_windows(window_length,window_step)
 
 def get_training_arrays(schema, table, ids, column, sample_rate,
         window_length, window_step,label):
@@ -2,7 +2,7 @@ import sys
 sys.path.append('../')
 from disaggregator import fhmm
 from disaggregator import PecanStreetDatasetAdapter as psda
-import pickle
+from disaggregator import registry
 
 def get_type_from_dataset(device_name,table_num,limit=0):
     '''
@@ -23,18 +23,19 @@ def get_type_from_dataset(device_name,table_num,limit=0):
     return device_type_orig
 
 def resample_and_split(device_type_orig,length='D',sample_rate='15T',split=True,sample=True):
-    if(sample):
-        device_type_unsplit=device_type_orig.resample(sample_rate)
+    if(sample and split):
+        device_type=device_type_orig.resample(sample_rate,split_by=length)
+    elif(sample):
+        device_type=device_type_orig.resample(sample_rate)
+    elif(split):
+        device_type=device_type_orig.split_by(length)
     else:
-        device_type_unsplit=device_type_orig
-    if(split):
-        device_type=device_type_unsplit.split_by(length)
-    else:
-        device_type=device_type_unsplit
+        device_type=device_type_orig
     return device_type
 
-def generate_and_pickle_models(device_name,pi_prior,a_prior,mean_prior,cov_prior,
-        key_for_model_name,table_num,length='D',sample_rate='15T',limit=0):
+def generate_and_save_models(device_name,pi_prior,a_prior,mean_prior,cov_prior,
+        key_for_model_name,table_num,length='D',sample_rate='15T',limit=0,
+        registry_path='models.hmm',month=None):
     device_type_orig=get_type_from_dataset(device_name,table_num,limit)
     print 'Device Type Generated.'
     device_type=resample_and_split(device_type_orig,length,sample_rate)
@@ -42,6 +43,11 @@ def generate_and_pickle_models(device_name,pi_prior,a_prior,mean_prior,cov_prior
     device_models=fhmm.generate_HMMs_from_type(device_type,pi_prior,a_prior,mean_prior,cov_prior,
             key_for_model_name)
     print 'Device Model Completed.'
-    with open(str(device_name)+'_'+str(table_num)+'_' + str(sample_rate)+'.pkl','w') as f:
-       pickle.dump(device_models,f)
+    # validated tables hold one month each, numbered by table_num
+    if month is None:
+        month=int(table_num)
+    metadata={'device':device_name,'table':table_num,'sample_rate':sample_rate,
+            'month':month}
+    registry.save_models(registry_path,device_models,metadata,
+            key_for_model_name,append=True)
     return device_type,device_models
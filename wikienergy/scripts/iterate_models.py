@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 from disaggregator import PecanStreetDatasetAdapter as psda
 from disaggregator import utils
 from disaggregator import fhmm
+from disaggregator import sweep
 from disaggregator import evaluation_metrics as metric
 from sklearn import hmm
 from copy import deepcopy
@@ -13,19 +14,15 @@ import pymc
 import pylab
 
 def get_model_error_from_trace0(test_instances,model,plot=False):
-    error=[]
-    for obs_house in test_instances:
-        obs_power=utils.trace_series_to_numpy_array(obs_house.traces[0].series)
-        est_states=model.predict(obs_power)
-        est_power=[]
-        for val in est_states:
-		est_power.append(float(np.random.normal(model._means_[val],model._covars_[val],1)[0]))
-        if(plot):
+    observations=sweep.get_observation_arrays(test_instances)
+    estimates=sweep.get_estimated_power(model,observations)
+    if(plot):
+        # plot the same estimates that are scored
+        for obs_power,est_power in zip(observations,estimates):
             plt.figure()
             plt.plot(obs_power,'k')
             plt.plot(est_power,'b',alpha=.5)
-        error.append(metric.sum_error(obs_power,np.array(est_power)))
-    return np.mean(error)
+    return sweep.get_estimate_error(observations,estimates)
 
 def get_test_data(num_houses):
 	devices_types_unsampled={}
@@ -58,40 +55,30 @@ def get_test_data(num_houses):
 	
 	return devices_types
 
-def make_model_metric_pickle(state1_min_mean,state1_max_mean,state1_min_cov,state1_max_cov,num_iter,num_test_houses):
+def make_model_metric_pickle(state1_min_mean,state1_max_mean,state1_min_cov,state1_max_cov,num_iter,num_test_houses,processes=None):
 	devices_types=get_test_data(num_test_houses)
-	errors_mean_cov=[]
 	error_dict={}
 	device_type_name='air1'
 	state1_means = np.linspace(state1_min_mean,state1_max_mean,num_iter)
 	state1_covs = np.linspace(state1_min_cov,state1_max_cov,num_iter)
-	best_error=100000000
-	for state1_mean in state1_means:
-	    errors_cov=[]
-	    for state1_cov in state1_covs:
-		print str(state1_mean)+", "+str(state1_cov)
-		pi_prior=np.array([0.9,0.1])
-		a_prior=np.array([[0.95,0.05],[0.05,0.95]])
-		mean_prior=np.array([[0],[state1_mean]])
-		cov_prior=np.array([[[0.0001]],[[state1_cov]]])
-		model = hmm.GaussianHMM(pi_prior.size,'full',pi_prior,a_prior)
-		model.means_ = mean_prior
-		model.covars_ = cov_prior
-		error=get_model_error_from_trace0(devices_types[device_type_name].instances,model)
-		if(error<best_error):
-		    best_mean=state1_mean
-		    best_cov=state1_cov
-		    best_error=error
-		errors_cov.append(error)  
-	    errors_mean_cov.append(errors_cov)
-	error_dict['error_vals']=errors_mean_cov
+	pi_prior=np.array([0.9,0.1])
+	a_prior=np.array([[0.95,0.05],[0.05,0.95]])
+	grid=sweep.get_two_state_prior_grid(pi_prior,a_prior,state1_means,state1_covs)
+	observations=sweep.get_observation_arrays(devices_types[device_type_name].instances)
+	filename=('error_m_'+str(state1_min_mean)+'_'+
+		  str(state1_max_mean)+'_c_'+str(state1_min_cov)+'_'+str(state1_max_cov))
+	checkpoint_path=filename+'_n_'+str(num_iter)+'_h_'+str(num_test_houses)+'.checkpoint'
+	errors=sweep.evaluate_grid(observations,grid,processes=processes,
+		checkpoint_path=checkpoint_path,verbose=True)
+	errors_mean_cov=errors.reshape(len(state1_means),len(state1_covs))
+	best_mean_index,best_cov_index=np.unravel_index(errors.argmin(),errors_mean_cov.shape)
+	error_dict['error_vals']=errors_mean_cov.tolist()
 	error_dict['cov_vals']=state1_covs
 	error_dict['mean_vals']=state1_means
-	error_dict['best_mean']=best_mean
-	error_dict['best_cov']=best_cov
-	error_dict['best_error']=best_error
-	with open('error_m_'+str(state1_min_mean)+'_'+
-		  str(state1_max_mean)+'_c_'+str(state1_min_cov)+'_'+str(state1_max_cov)+'.pkl','w') as f:
+	error_dict['best_mean']=state1_means[best_mean_index]
+	error_dict['best_cov']=state1_covs[best_cov_index]
+	error_dict['best_error']=errors.min()
+	with open(filename+'.pkl','w') as f:
 	    pickle.dump(error_dict,f)
 
 
@@ -101,4 +88,4 @@ state1_min_cov=0.0001
 state1_max_cov=0.1
 num_iter=50
 num_houses=25
-make_model_metric_pickle(state1_min_mean,state1_max_mean,state1_min_cov,state1_max_cov,num_iter,num_houses)
+make_model_metric_pickle(state1_min_mean,state1_max_mean,state1_min_cov,state1_max_cov,num_iter,num_houses,processes=4)
@@ -20,5 +20,32 @@ class ApplianceSetTestCase(unittest.TestCase):
     def test_alignment(self):
         self.assert_(da.instances_aligned(self.normal_set.instances))
 
+    def test_top_k_and_non_zero_sets(self):
+        index = pd.date_range('1/1/2013', periods=200, freq='15T')
+        instances = []
+        for name, value in [('a', 1.0), ('b', 0.0), ('c', 3.0)]:
+            series = pd.Series(np.ones(200) * value, index=index, name=name)
+            instances.append(da.ApplianceInstance([da.ApplianceTrace(series,{})],{}))
+        appliance_set = da.ApplianceSet(instances,{})
+        df = appliance_set.get_dataframe()
+        self.assertListEqual(list(df.columns), ['a','b','c'])
+        np.testing.assert_array_equal(appliance_set.get_usage_totals(),
+                                      [200., 0., 600.])
+        top = appliance_set.generate_top_k_set(2)
+        self.assertListEqual(list(top.get_dataframe().columns), ['c','a'])
+        non_zero = appliance_set.generate_non_zero_set()
+        self.assertEqual(len(non_zero.instances), 2)
+
+    def test_int64_matrix(self):
+        index = pd.date_range('1/1/2013', periods=200, freq='15T')
+        instances = []
+        for value, storage in [(1.5, 'int64'), (2.0, 'float64')]:
+            series = da.convert_series_storage(
+                    pd.Series(np.ones(200) * value, index=index), storage)
+            instances.append(da.ApplianceInstance([da.ApplianceTrace(series,{})],{}))
+        appliance_set = da.ApplianceSet(instances,{})
+        np.testing.assert_array_equal(appliance_set.get_usage_totals(),
+                                      [300., 400.])
+
 if __name__ == "__main__":
     unittest.main()
@@ -29,5 +29,66 @@ class ApplianceTraceTestCase(unittest.TestCase):
                               pd.DatetimeIndex,
                               'trace series index should be pd.DatetimeIndex')
 
+    def test_resample_storage(self):
+        trace = self.normal_trace.resample('1H')
+        self.assertEqual(trace.series.dtype, np.float64,
+                         'resampled series should be float64')
+        trace = self.normal_trace.resample('1H',storage='int64')
+        self.assertEqual(trace.series.dtype, np.int64,
+                         'resampled series should be int64')
+
+    def test_resample_int64_round_trip(self):
+        index = pd.date_range('1/1/2013', periods=8, freq='15T')
+        series = pd.Series([1.0, 3.0, 2.5, 4.5, 0.0, 0.0, 2.0, 2.0],
+                           index=index)
+        int_trace = da.ApplianceTrace(series, {}).to_storage('int64')
+        for sample_rate in ['30T', '45T']:
+            expected = da.ApplianceTrace(series, {}).resample(sample_rate,
+                    storage='int64')
+            trace = int_trace.resample(sample_rate, storage='int64')
+            self.assertEqual(trace.series.dtype, np.int64)
+            self.assertListEqual(trace.series.tolist(),
+                                 expected.series.tolist())
+        self.assertListEqual(int_trace.resample('30T').series.tolist(),
+                             [2.0, 3.5, 0.0, 2.0])
+
+    def test_resample_matches_pandas(self):
+        for start in ['1/1/2013','1/1/2013 00:07']:
+            index = pd.date_range(start, periods=100, freq='1T')
+            values = np.arange(100.0)
+            values[::7] = np.nan
+            trace = da.ApplianceTrace(pd.Series(values, index=index), {})
+            for method in ['mean','sum','max']:
+                expected = pd.Series(values, index=index).resample('15T',
+                        how=method).fillna(0)
+                series = trace.resample('15T', method).series
+                self.assertTrue(series.index.equals(expected.index))
+                np.testing.assert_allclose(series.values, expected.values)
+
+    def test_split_by(self):
+        index = pd.date_range('1/1/2013 05:00', periods=4*1440, freq='1T')
+        series = pd.Series(np.arange(len(index), dtype=float), index=index)
+        trace = da.ApplianceTrace(series, {'dataid': 1})
+        traces = trace.split_by('D')
+        groups = [group for _, group in series.groupby(index.date)]
+        self.assertEqual(len(traces), len(groups))
+        for i, (split_trace, group) in enumerate(zip(traces, groups)):
+            self.assertTrue(split_trace.series.index.equals(group.index))
+            np.testing.assert_array_equal(split_trace.series.values,
+                                          group.values)
+            self.assertEqual(split_trace.metadata,
+                             {'dataid': 1, 'trace_num': i})
+        self.assertNotIn('trace_num', trace.metadata)
+
+    def test_to_storage(self):
+        index = pd.date_range('1/1/2013', periods=3, freq='15T')
+        series = pd.Series([1.5, np.nan, 2.25], index=index)
+        trace = da.ApplianceTrace(series,{})
+        int_trace = trace.to_storage('int64',scale=100)
+        self.assertListEqual(int_trace.series.tolist(), [150, 0, 225])
+        decimal_trace = trace.to_storage('decimal')
+        self.assertEqual(decimal_trace.series.dtype, np.object_)
+        self.assertIs(trace.to_storage('float64').series, series)
+
 if __name__ == "__main__":
     unittest.main()
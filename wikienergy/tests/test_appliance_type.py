@@ -3,14 +3,32 @@ import os.path
 sys.path.append(os.path.abspath(os.pardir))
 import disaggregator as da
 import unittest
+import pandas as pd
+import numpy as np
 
 class ApplianceTypeTestCase(unittest.TestCase):
 
     def setUp(self):
-        pass
+        index = pd.date_range('1/1/2013', periods=2*1440, freq='1T')
+        instances = []
+        for dataid in range(3):
+            series = pd.Series(np.random.rand(len(index)), index=index)
+            trace = da.ApplianceTrace(series, {'dataid': dataid})
+            instances.append(da.ApplianceInstance([trace],
+                                                  {'dataid': dataid}))
+        self.type = da.ApplianceType(instances, {})
 
-    def test_(self):
-        pass
+    def test_resample_split_by(self):
+        split_type = self.type.resample('15T', split_by='D')
+        chained_type = self.type.resample('15T').split_by('D')
+        for instance, chained in zip(split_type.instances,
+                                     chained_type.instances):
+            self.assertEqual(len(instance.traces), 2)
+            for trace, chained_trace in zip(instance.traces,
+                                            chained.traces):
+                self.assertEqual(len(trace.series), 96)
+                np.testing.assert_array_equal(trace.series.values,
+                                              chained_trace.series.values)
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,74 @@
+import sys
+import os.path
+sys.path.append(os.path.abspath(os.pardir))
+from disaggregator import cache
+import unittest
+import tempfile
+import shutil
+import pandas as pd
+import numpy as np
+
+class TraceCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        index = pd.date_range('1/1/2013', periods=96, freq='15T', tz='UTC')
+        self.series = [pd.Series(np.arange(96.0), index=index, name='air1'),
+                       pd.Series(np.ones(96), index=index, name='use')]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_round_trip(self):
+        trace_cache = cache.TraceCache(self.path)
+        key = cache.get_key('shared','validated_01_2014',1,['air1','use'],None)
+        trace_cache.put(key,cache.series_to_arrays(self.series))
+        reloaded = cache.TraceCache(self.path)
+        series = cache.arrays_to_series(reloaded.get(key))
+        for s, expected in zip(series,self.series):
+            self.assertEqual(s.name,expected.name)
+            np.testing.assert_array_equal(s.values,expected.values)
+            self.assertTrue(s.index.equals(expected.index))
+
+    def test_corrupt_entry_is_discarded(self):
+        trace_cache = cache.TraceCache(self.path)
+        trace_cache.put('a',{'values':np.arange(5)})
+        trace_cache.index['a']['hash'] = 'bad'
+        self.assertIsNone(trace_cache.get('a'))
+        self.assertNotIn('a',trace_cache.index)
+
+    def test_lru_eviction(self):
+        trace_cache = cache.TraceCache(self.path)
+        trace_cache.put('a',{'values':np.zeros(1000)})
+        entry_bytes = trace_cache.get_size()
+        trace_cache.max_bytes = 2 * entry_bytes
+        trace_cache.put('b',{'values':np.zeros(1000)})
+        os.utime(os.path.join(self.path,'a.npz'),(0,0))
+        os.utime(os.path.join(self.path,'b.npz'),(0,0))
+        trace_cache.get('a')
+        trace_cache.put('c',{'values':np.zeros(1000)})
+        self.assertIn('a',trace_cache.index)
+        self.assertNotIn('b',trace_cache.index)
+
+    def test_get_does_not_write_index(self):
+        trace_cache = cache.TraceCache(self.path)
+        trace_cache.put('a',{'values':np.arange(5)})
+        os.utime(trace_cache.index_path,(0,0))
+        self.assertIsNotNone(trace_cache.get('a'))
+        self.assertEqual(os.path.getmtime(trace_cache.index_path),0)
+
+    def test_shared_index(self):
+        first = cache.TraceCache(self.path)
+        second = cache.TraceCache(self.path)
+        first.put('a',{'values':np.arange(5)})
+        second.put('b',{'values':np.arange(3)})
+        np.testing.assert_array_equal(first.get('b')['values'],np.arange(3))
+        self.assertListEqual(sorted(cache.TraceCache(self.path).index),
+                             ['a','b'])
+
+    def test_offline_miss(self):
+        trace_cache = cache.TraceCache(self.path,offline=True)
+        self.assertRaises(cache.CacheMissError,trace_cache.get,'missing')
+
+if __name__ == "__main__":
+    unittest.main()
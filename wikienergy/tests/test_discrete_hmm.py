@@ -0,0 +1,63 @@
+import sys
+import os.path
+sys.path.append(os.path.abspath(os.pardir))
+from disaggregator import discrete_hmm
+import unittest
+import itertools
+import numpy as np
+
+class DiscreteHMMTestCase(unittest.TestCase):
+
+    def setUp(self):
+        A = np.array([[0.95,0.05],[0.1,0.9]])
+        B = np.array([[1.0/6]*6,[0.1]*5+[0.5]])
+        self.hmm = discrete_hmm.DiscreteHMM(2,[1,2,3,4,5,6],A=A,B=B)
+        self.obs = [1,6,6,2,6,3,6,6]
+
+    def _path_log_prob(self, path):
+        hmm = self.hmm
+        indices = hmm.get_symbol_indices(self.obs)
+        log_prob = np.log(hmm.Pi[path[0]] * hmm.B[path[0],indices[0]])
+        for t in range(1,len(path)):
+            log_prob += np.log(hmm.A[path[t-1],path[t]] *
+                               hmm.B[path[t],indices[t]])
+        return log_prob
+
+    def test_forward(self):
+        paths = list(itertools.product(range(2),repeat=len(self.obs)))
+        expected = np.log(sum(np.exp(self._path_log_prob(p)) for p in paths))
+        log_prob, alpha, scales = discrete_hmm.forward(self.hmm,self.obs)
+        self.assertAlmostEqual(log_prob,expected)
+        beta = discrete_hmm.backward(self.hmm,self.obs,scales)
+        np.testing.assert_allclose((alpha * beta).sum(axis=1),1)
+
+    def test_viterbi(self):
+        paths = list(itertools.product(range(2),repeat=len(self.obs)))
+        expected = max(paths,key=self._path_log_prob)
+        path, log_prob = discrete_hmm.viterbi(self.hmm,self.obs)
+        self.assertListEqual(list(path),list(expected))
+        self.assertAlmostEqual(log_prob,self._path_log_prob(expected))
+        batch_paths, _ = discrete_hmm.viterbi(self.hmm,[self.obs,self.obs])
+        np.testing.assert_array_equal(batch_paths[1],path)
+
+    def test_baum_welch(self):
+        sequences = [self.obs, self.obs[:5], [1,2,3,4,5,6,6,6]]
+        _, log_likelihoods = discrete_hmm.baum_welch(self.hmm,sequences,
+                                                     n_iter=5)
+        self.assertTrue(np.all(np.diff(log_likelihoods) >= -1e-9))
+        np.testing.assert_allclose(self.hmm.A.sum(axis=1),1)
+        np.testing.assert_allclose(self.hmm.B.sum(axis=1),1)
+
+    def test_baum_welch_processes(self):
+        sequences = [self.obs, self.obs[:5], [1,2,3,4,5,6,6,6], self.obs]
+        A, B = self.hmm.A.copy(), self.hmm.B.copy()
+        _, serial = discrete_hmm.baum_welch(self.hmm,sequences,n_iter=3)
+        parallel_hmm = discrete_hmm.DiscreteHMM(2,[1,2,3,4,5,6],A=A,B=B)
+        _, parallel = discrete_hmm.baum_welch(parallel_hmm,sequences,
+                                              n_iter=3,processes=2)
+        np.testing.assert_allclose(parallel,serial)
+        np.testing.assert_allclose(parallel_hmm.A,self.hmm.A)
+        np.testing.assert_allclose(parallel_hmm.B,self.hmm.B)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,8 +32,28 @@ class EvaluationMetricsTestCase(unittest.TestCase):
         pass
 
     def test_truth_from_power(self):
-        #print evm.guess_truth_from_power(np.array([2,3,4,51,2]),3)
-        pass
+        truth = evm.guess_truth_from_power(np.array([2,3,4,51,2]),3)
+        np.testing.assert_array_equal(truth,[0,1,1,1,0])
+
+    def test_get_confusion_counts(self):
+        truth = np.array([1,1,0,0,1,0])
+        prediction = np.array([1,0,0,1,1,0])
+        stats = evm.get_positive_negative_stats(truth,prediction)
+        counts = evm.get_confusion_counts(truth,prediction)
+        for key in ['tp','fn','tn','fp']:
+            self.assertEqual(counts[key],stats[key].sum())
+        self.assertEqual(evm.get_f1_score(counts),evm.get_f1_score(stats))
+        self.assertEqual(evm.get_accuracy(counts),evm.get_accuracy(stats))
+
+    def test_get_confusion_counts_for_thresholds(self):
+        truth = np.array([1,1,0,0,1,0])
+        power = np.array([5.,1.,0.,3.,2.,1.])
+        thresholds = [0.5,1.,2.5,10.]
+        all_counts = evm.get_confusion_counts_for_thresholds(truth,power,
+                                                             thresholds)
+        for threshold,counts in zip(thresholds,all_counts):
+            prediction = evm.guess_truth_from_power(power,threshold)
+            self.assertEqual(counts,evm.get_confusion_counts(truth,prediction))
 
     def test_fraction_energy_assigned_correctly(self):
         traces = [[1,1,1,1,1],[5,5,5,5,5],[0,0,0,0,0]]
@@ -62,5 +82,25 @@ class EvaluationMetricsTestCase(unittest.TestCase):
                  'tn':np.array([0,0])}
         evm.get_table_of_confusion(stats)
 
+    def test_metrics_accumulator(self):
+        truth = np.array([0.,2.,3.,0.,5.,1.])
+        prediction = np.array([1.,2.,0.,0.,4.,1.])
+        true_states = evm.guess_truth_from_power(truth,1)
+        predicted_states = evm.guess_truth_from_power(prediction,1)
+        first = evm.MetricsAccumulator()
+        first.update(truth[:4],prediction[:4],true_states[:4],
+                     predicted_states[:4],'air1')
+        second = evm.MetricsAccumulator()
+        second.update(truth[4:],prediction[4:],true_states[4:],
+                      predicted_states[4:],'air1')
+        report = first.merge(second).report()
+        stats = evm.get_positive_negative_stats(true_states,predicted_states)
+        self.assertEqual(report['rss'],evm.rss(truth,prediction))
+        self.assertEqual(report['sum_error'],evm.sum_error(truth,prediction))
+        self.assertEqual(report['f1_score'],evm.get_f1_score(stats))
+        self.assertEqual(report['accuracy'],evm.get_accuracy(stats))
+        self.assertAlmostEqual(report['fraction_energy_assigned_correctly'],
+                               8/11.)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,151 @@
+import sys
+import os.path
+sys.path.append(os.path.abspath(os.pardir))
+import disaggregator as da
+from disaggregator import fhmm
+import unittest
+import pandas as pd
+import numpy as np
+from collections import OrderedDict
+
+class FactorialHMMTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.type_models = OrderedDict()
+        for name, means in [('air1',[0.0,2.0]),('furnace1',[0.0,0.5,1.0]),
+                            ('refrigerator1',[0.1,0.3])]:
+            n = len(means)
+            transmat = np.full((n,n),0.05 / (n - 1))
+            np.fill_diagonal(transmat,0.95)
+            self.type_models[name] = fhmm.init_HMM(np.ones(n) / n,transmat,
+                    np.array(means)[:,np.newaxis],np.tile(0.01,(n,1,1)))
+        self.power_total = np.abs(random_state.normal(1.5,1.0,(200,1)))
+
+    def test_exact_matches_combined_hmm(self):
+        model_fhmm, means, _ = fhmm.generate_FHMM_from_HMMs(self.type_models)
+        expected = model_fhmm.predict(self.power_total)
+        dims = [len(means[name]) for name in self.type_models]
+        states, _ = fhmm.predict_with_factorial_HMMs(self.type_models,
+                self.power_total,method='exact')
+        combined = np.ravel_multi_index([states[name]
+                                         for name in self.type_models],dims)
+        np.testing.assert_array_equal(combined,expected)
+
+    def test_icm_states_are_valid(self):
+        states, power = fhmm.predict_with_factorial_HMMs(self.type_models,
+                self.power_total,method='icm')
+        for name, model in self.type_models.items():
+            self.assertEqual(len(states[name]),len(self.power_total))
+            self.assertTrue(np.all(states[name] >= 0))
+            self.assertTrue(np.all(states[name] < model.n_components))
+            np.testing.assert_array_equal(power[name],
+                    model.means_.ravel()[states[name]])
+
+    def test_predict_states(self):
+        model_fhmm, _, _ = fhmm.generate_FHMM_from_HMMs(self.type_models)
+        np.testing.assert_array_equal(
+                fhmm.predict_states(model_fhmm,self.power_total),
+                model_fhmm.predict(self.power_total))
+        np.testing.assert_array_equal(
+                fhmm.predict_states(model_fhmm,self.power_total,decimals=1),
+                model_fhmm.predict(np.round(self.power_total,1)))
+
+    def test_log_likelihood_matrix_processes(self):
+        models = self.type_models.values()
+        observations = [self.power_total,self.power_total[:50],
+                        self.power_total[50:100]]
+        serial = fhmm.get_log_likelihood_matrix(models,observations)
+        parallel = fhmm.get_log_likelihood_matrix(models,observations,
+                                                  processes=2)
+        np.testing.assert_allclose(parallel,serial)
+        for i,model in enumerate(models):
+            for j,obs in enumerate(observations):
+                self.assertAlmostEqual(serial[i,j],model.score(obs))
+
+    def test_generate_HMMs_from_type_seed(self):
+        index = pd.date_range('1/1/2013', periods=96, freq='15T')
+        random_state = np.random.RandomState(1)
+        instances = []
+        for dataid in range(3):
+            on = random_state.rand(len(index)) > 0.7
+            series = pd.Series(on * 2.0 + random_state.rand(len(index)) * 0.1,
+                               index=index)
+            instances.append(da.ApplianceInstance(
+                    [da.ApplianceTrace(series,{'dataid':dataid})],{}))
+        device_type = da.ApplianceType(instances,{})
+        priors = (np.array([0.9,0.1]),np.array([[0.95,0.05],[0.05,0.95]]),
+                  np.array([[0.0],[2.0]]),np.array([[[0.01]],[[0.1]]]))
+        np.random.seed(5)
+        expected_draw = np.random.rand()
+        np.random.seed(5)
+        serial = fhmm.generate_HMMs_from_type(device_type,*priors,
+                key_for_model_name='dataid',seed=0)
+        self.assertEqual(np.random.rand(),expected_draw)
+        parallel = fhmm.generate_HMMs_from_type(device_type,*priors,
+                key_for_model_name='dataid',processes=2,seed=0)
+        self.assertListEqual(serial.keys(),parallel.keys())
+        for dataid in serial:
+            np.testing.assert_array_equal(serial[dataid].means_,
+                                          parallel[dataid].means_)
+            np.testing.assert_array_equal(serial[dataid].covars_,
+                                          parallel[dataid].covars_)
+            np.testing.assert_array_equal(serial[dataid].transmat_,
+                                          parallel[dataid].transmat_)
+
+    def test_decode_hmm(self):
+        centroids = {'air1': np.array([[0.5],[2.0]]),
+                     'furnace1': np.array([[0.2],[1.0],[3.0]])}
+        variances = {'air1': np.tile(0.01,(2,1,1)),
+                     'furnace1': np.tile(0.01,(3,1,1))}
+        names = ['air1','furnace1']
+        air_states = np.array([0,0,1,1,0,1])
+        furnace_states = np.array([0,1,2,0,2,1])
+        states = air_states * 3 + furnace_states
+        for method in ['mean','sample']:
+            decoded_states, decoded_power = fhmm._decode_hmm(len(states),
+                    centroids,variances,names,states,method)
+            np.testing.assert_array_equal(decoded_states['air1'],air_states)
+            np.testing.assert_array_equal(decoded_states['furnace1'],
+                                          furnace_states)
+            for name, appliance_states in [('air1',air_states),
+                                           ('furnace1',furnace_states)]:
+                power = decoded_power[name]
+                mu = centroids[name].ravel()[appliance_states]
+                np.testing.assert_array_equal(power[appliance_states == 0],0)
+                on = appliance_states > 0
+                if method == 'mean':
+                    np.testing.assert_array_equal(power[on],mu[on])
+                else:
+                    np.testing.assert_allclose(power[on],mu[on],atol=0.1)
+
+    def _get_sequence_model(self):
+        model = fhmm.init_HMM(np.array([0.9,0.1]),
+                np.array([[0.95,0.05],[0.05,0.95]]),
+                np.array([[0.0],[2.0]]),np.array([[[0.01]],[[0.1]]]))
+        model.init_params = ''
+        return model
+
+    def test_fit_sequences_matches_fit(self):
+        random_state = np.random.RandomState(2)
+        sequences = [np.where(random_state.rand(200,1) > 0.6,2.0,0.0) +
+                     random_state.randn(200,1) * 0.1 for _ in range(4)]
+        expected = self._get_sequence_model().fit(sequences[:1])
+        model = fhmm.fit_sequences_to_HMM(self._get_sequence_model(),
+                                          sequences[:1])
+        order = np.argsort(expected.means_.ravel())
+        np.testing.assert_allclose(model.means_,expected.means_[order])
+        np.testing.assert_allclose(model.covars_,expected.covars_[order])
+        np.testing.assert_allclose(model.transmat_,
+                expected.transmat_[order][:,order])
+        serial = fhmm.fit_sequences_to_HMM(self._get_sequence_model(),
+                                           sequences)
+        parallel = fhmm.fit_sequences_to_HMM(self._get_sequence_model(),
+                                             sequences,processes=2)
+        np.testing.assert_allclose(parallel.means_,serial.means_)
+        np.testing.assert_allclose(parallel.covars_,serial.covars_)
+        np.testing.assert_allclose(parallel.transmat_,serial.transmat_)
+        np.testing.assert_allclose(parallel.startprob_,serial.startprob_)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,8 @@ from disaggregator import PecanStreetDatasetAdapter as psda
 
 import settings
 import unittest
+import pandas as pd
+import numpy as np
 
 
 class PecanStreetDatasetAdapterTestCase(unittest.TestCase):
@@ -35,6 +37,127 @@ class PecanStreetDatasetAdapterTestCase(unittest.TestCase):
         # trace = p.get_month_traces_wo_time_align('shared',str(tables[0]),i[0])
         pass
 
+class TracesFromDataframeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        times = pd.date_range('1/1/2014', periods=8, freq='15T')
+        self.df = pd.DataFrame({'localminute': list(times),
+                                'air1': [1.0, 3.0, 2.5, 4.5, 0.0, None,
+                                         2.0, 2.0]})
+
+    def test_int64_storage_with_sample_rate(self):
+        traces = psda._traces_from_dataframe(self.df.copy(),'shared',
+                'validated_01_2014',['air1'],1,'30T','int64')
+        float_traces = psda._traces_from_dataframe(self.df.copy(),'shared',
+                'validated_01_2014',['air1'],1,'30T')
+        self.assertEqual(traces[0].series.dtype, np.int64)
+        self.assertListEqual(traces[0].series.tolist(),
+                             [2000, 3500, 0, 2000])
+        self.assertListEqual(float_traces[0].series.tolist(),
+                             [2.0, 3.5, 0.0, 2.0])
+
+class ChunkedDataframeTestCase(unittest.TestCase):
+
+    def test_typed_dataframe(self):
+        from decimal import Decimal
+        float_columns = psda._get_float_columns([('air1',1700),
+                                                 ('table_name',25),
+                                                 ('use',None)])
+        first = psda._typed_dataframe([(None,'a',None),(None,'a',None)],
+                                      ['air1','table_name','use'],
+                                      float_columns)
+        second = psda._typed_dataframe([(Decimal('1.5'),'b',Decimal('2'))],
+                                       ['air1','table_name','use'],
+                                       float_columns)
+        third = psda._typed_dataframe([(None,'c',None)],
+                                      ['air1','table_name','use'],
+                                      float_columns)
+        self.assertEqual(first['air1'].dtype, np.float64)
+        self.assertEqual(second['air1'].dtype, np.float64)
+        self.assertEqual(second['use'].dtype, np.float64)
+        self.assertEqual(third['use'].dtype, np.float64)
+        self.assertEqual(second['table_name'].dtype, np.object_)
+        df = pd.concat([first,second,third],ignore_index=True)
+        self.assertEqual(df['air1'].dtype, np.float64)
+
+    def test_iter_row_groups(self):
+        df = pd.DataFrame({'dataid': [1,1,1,2,2,3],
+                           'table_name': ['a','a','b','a','a','a'],
+                           'use': np.arange(6.0)})
+        chunks = [df.iloc[:2],df.iloc[2:4],df.iloc[4:4],df.iloc[4:]]
+        groups = list(psda.iter_row_groups(chunks,['dataid','table_name']))
+        self.assertListEqual([key for key,_ in groups],
+                             [(1,'a'),(1,'b'),(2,'a'),(3,'a')])
+        self.assertListEqual([group['use'].tolist() for _,group in groups],
+                             [[0.0,1.0],[2.0],[3.0,4.0],[5.0]])
+
+    def test_shuffled_rows(self):
+        times = pd.date_range('1/1/2014', periods=12, freq='15T')
+        df = pd.DataFrame({'dataid': [1] * 12,
+                           'table_name': ['validated_01_2014'] * 12,
+                           'localminute': list(times),
+                           'air1': np.arange(12.0)})
+        shuffled = df.iloc[np.random.RandomState(0).permutation(12)]
+        chunks = [shuffled.iloc[:5],shuffled.iloc[5:]]
+        groups = list(psda.iter_row_groups(chunks,['dataid','table_name']))
+        self.assertEqual(len(groups),1)
+        (dataid,table),group = groups[0]
+        traces = psda._traces_from_dataframe(
+                group.drop(['dataid','table_name'],axis=1),'shared',table,
+                ['air1'],dataid)
+        series = traces[0].series
+        self.assertTrue(series.index.is_monotonic_increasing)
+        self.assertListEqual(series.tolist(),list(np.arange(12.0)))
+
+    def test_iter_dataframe_chunks_retries(self):
+        eng = psda.eng
+        psda.eng = FlakyEngine([[(1.0,),(2.0,)],[(3.0,)]],1)
+        retry_delay = psda.retry_delay
+        psda.retry_delay = 0
+        try:
+            chunks = list(psda.iter_dataframe_chunks('select use',2))
+        finally:
+            psda.eng = eng
+            psda.retry_delay = retry_delay
+        self.assertListEqual([chunk['use'].tolist() for chunk in chunks],
+                             [[1.0,2.0],[3.0]])
+
+class FlakyEngine(object):
+    '''
+    A stand-in engine whose first n_failures connections fail to execute.
+    '''
+
+    def __init__(self, chunks, n_failures):
+        self.chunks = chunks
+        self.n_failures = n_failures
+
+    def connect(self):
+        return self
+
+    def execution_options(self, **options):
+        return self
+
+    def execute(self, query):
+        if self.n_failures > 0:
+            self.n_failures -= 1
+            raise psda.sqlalchemy.exc.OperationalError(query,None,None)
+        return FlakyResult(list(self.chunks))
+
+    def close(self):
+        pass
+
+class FlakyResult(object):
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.cursor = None
+
+    def keys(self):
+        return ['use']
+
+    def fetchmany(self, size):
+        return self.chunks.pop(0) if self.chunks else []
+
 #fast = unittest.TestSuite()
 #fast.addTest(PecanStreetDatasetAdapterTestCase.test_get_table_names)
 
@@ -0,0 +1,94 @@
+import sys
+import os.path
+sys.path.append(os.path.abspath(os.pardir))
+from disaggregator import fhmm
+from disaggregator import registry
+import unittest
+import tempfile
+import shutil
+import numpy as np
+from sklearn import hmm
+
+class ModelRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir,'models.hmm')
+        self.models = {}
+        for dataid in [1,2]:
+            self.models[dataid] = fhmm.init_HMM(np.array([0.9,0.1]),
+                    np.array([[0.95,0.05],[0.05,0.95]]),
+                    np.array([[0.0],[float(dataid)]]),
+                    np.array([[[0.01]],[[0.1 * dataid]]]))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        registry.save_models(self.path,self.models,
+                             {'device':'air1','month':1},'dataid')
+        registry.save_models(self.path,{1:self.models[2]},
+                             {'device':'furnace1','month':1},'dataid',
+                             append=True)
+        for mmap in [True,False]:
+            model_registry = registry.ModelRegistry(self.path,mmap=mmap)
+            self.assertEqual(len(model_registry),3)
+            models = model_registry.get_models(device='air1',
+                                               key_for_model_name='dataid')
+            self.assertListEqual(sorted(models.keys()),[1,2])
+            for dataid, model in models.items():
+                expected = self.models[dataid]
+                np.testing.assert_array_equal(model.means_,expected.means_)
+                np.testing.assert_array_equal(model.covars_,expected.covars_)
+                np.testing.assert_array_equal(model.transmat_,
+                                              expected.transmat_)
+            found = model_registry.find(device='furnace1',dataid=1)
+            self.assertEqual(len(found),1)
+            np.testing.assert_array_equal(
+                    model_registry.get_parameters(found[0])[2],
+                    self.models[2].means_)
+            self.assertEqual(model_registry.find(month=2),[])
+
+    def test_append_replaces_duplicates(self):
+        for _ in range(2):
+            registry.save_models(self.path,self.models,
+                                 {'device':'air1','month':1},'dataid',
+                                 append=True)
+        model_registry = registry.ModelRegistry(self.path)
+        self.assertEqual(len(model_registry),2)
+        registry.save_models(self.path,{1:self.models[2]},
+                             {'device':'air1','month':1},'dataid',
+                             append=True)
+        model_registry = registry.ModelRegistry(self.path)
+        models = model_registry.get_models(device='air1',
+                                           key_for_model_name='dataid')
+        np.testing.assert_array_equal(models[1].means_,
+                                      self.models[2].means_)
+        np.testing.assert_array_equal(models[2].means_,
+                                      self.models[2].means_)
+        registry.save_models(self.path,self.models,{'device':'air1',
+                             'month':2},'dataid',append=True)
+        model_registry = registry.ModelRegistry(self.path)
+        self.assertRaises(ValueError,model_registry.get_models,
+                          device='air1',key_for_model_name='dataid')
+
+    def test_covariance_types(self):
+        covars = {'full': np.tile(np.eye(2),(3,1,1)),
+                  'diag': np.arange(1.0,7.0).reshape(3,2),
+                  'spherical': np.array([1.0,2.0,3.0]),
+                  'tied': np.array([[2.0,0.5],[0.5,1.0]])}
+        models = {}
+        for covariance_type, covar in covars.items():
+            model = hmm.GaussianHMM(3,covariance_type,np.ones(3) / 3,
+                                    np.ones((3,3)) / 3)
+            model.means_ = np.arange(6.0).reshape(3,2)
+            model.covars_ = covar
+            models[covariance_type] = model
+        registry.save_models(self.path,models)
+        model_registry = registry.ModelRegistry(self.path)
+        for name, model in model_registry.get_models().items():
+            self.assertEqual(model.covariance_type,name)
+            np.testing.assert_array_equal(model.covars_,models[name].covars_)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import sys
+import os.path
+sys.path.append(os.path.abspath(os.pardir))
+from disaggregator import sweep
+from disaggregator import fhmm
+import unittest
+import tempfile
+import shutil
+import pickle
+import numpy as np
+
+class SweepTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        on = np.tile([0,0,1,1,1,0,0,0],20)[:,np.newaxis]
+        self.observations = [on * 2.5, on * 2.0]
+        self.grid = sweep.get_two_state_prior_grid(np.array([0.9,0.1]),
+                np.array([[0.95,0.05],[0.05,0.95]]),[1.5,2.5],[0.01,0.1])
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_evaluate_grid(self):
+        errors = sweep.evaluate_grid(self.observations,self.grid,
+                                     method='mean')
+        self.assertEqual(errors.shape,(4,))
+        self.assertTrue(errors[2] < errors[0])
+
+    def test_estimated_power(self):
+        model = fhmm.init_HMM(*self.grid[2])
+        estimates = sweep.get_estimated_power(model,self.observations,
+                random_state=np.random.RandomState(0))
+        self.assertEqual(len(estimates),2)
+        self.assertEqual(sweep.get_estimate_error(self.observations,estimates),
+                         sweep.get_model_error(model,self.observations,
+                                 random_state=np.random.RandomState(0)))
+
+    def test_checkpoint_resume(self):
+        checkpoint_path = os.path.join(self.path,'sweep.pkl')
+        errors = sweep.evaluate_grid(self.observations,self.grid,seed=0,
+                                     checkpoint_path=checkpoint_path)
+        with open(checkpoint_path,'rb') as f:
+            checkpoint = pickle.load(f)
+        checkpoint['errors'][0] = -1.0
+        with open(checkpoint_path,'wb') as f:
+            pickle.dump(checkpoint,f)
+        resumed = sweep.evaluate_grid(self.observations,self.grid,seed=0,
+                                      checkpoint_path=checkpoint_path)
+        self.assertEqual(resumed[0],-1.0)
+        np.testing.assert_array_equal(errors[1:],resumed[1:])
+
+    def test_stale_checkpoint(self):
+        checkpoint_path = os.path.join(self.path,'sweep.pkl')
+        sweep.evaluate_grid(self.observations,self.grid,seed=0,
+                            checkpoint_path=checkpoint_path)
+        self.assertRaises(ValueError,sweep.evaluate_grid,
+                          self.observations[:1],self.grid,seed=0,
+                          checkpoint_path=checkpoint_path)
+        other_grid = sweep.get_two_state_prior_grid(np.array([0.9,0.1]),
+                np.array([[0.95,0.05],[0.05,0.95]]),[1.0,2.5],[0.01,0.1])
+        self.assertRaises(ValueError,sweep.evaluate_grid,self.observations,
+                          other_grid,seed=0,checkpoint_path=checkpoint_path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -46,6 +46,94 @@ class UtilsTestCase(unittest.TestCase):
         aligned_traces = da.align_traces(self.consecutive_traces)
         da.aggregate_traces(aligned_traces,{})
 
+    def test_align_traces_views(self):
+        aligned_traces = da.align_traces(self.consecutive_traces)
+        self.assertTrue(da.traces_aligned(aligned_traces))
+        for trace, aligned in zip(self.consecutive_traces, aligned_traces):
+            self.assertTrue(np.shares_memory(trace.series.values,
+                                             aligned.series.values))
+        self.assertEqual(self.consecutive_traces[1].series.index[0],
+                         datetime(2013,1,2))
+        da.aggregate_traces(aligned_traces,{})
+        self.assertEqual(self.consecutive_traces[0].series.sum(), 0)
+
+    def test_align_traces_read_only(self):
+        aligned_traces = da.align_traces(self.consecutive_traces)
+        def write(series):
+            series.values[0] = 1.0
+        self.assertRaises(ValueError, write, aligned_traces[1].series)
+        filled = aligned_traces[1].series.copy()
+        filled[0] = 1.0
+        self.assertEqual(self.consecutive_traces[1].series.sum(), 0)
+        self.assertTrue(self.consecutive_traces[1].series.values.flags.writeable)
+
+    def test_aggregate_traces_weighted(self):
+        traces = da.align_traces(self.consecutive_traces)
+        for i, trace in enumerate(traces):
+            trace.series = trace.series + i
+        weights = [1, 0, 2, 0, 1]
+        for chunk_size in [None, 2]:
+            total = da.aggregate_traces(traces,{},weights=weights,
+                                        chunk_size=chunk_size)
+            np.testing.assert_array_equal(total.series.values,
+                                          np.ones(24*4) * 8)
+        total = da.aggregate_traces(traces,{},chunk_size=2)
+        np.testing.assert_array_equal(total.series.values,np.ones(24*4) * 10)
+        self.assertEqual(traces[0].series.sum(), 0)
+
+    def test_aggregate_traces_int64(self):
+        traces = da.align_traces(self.consecutive_traces)
+        for trace in traces:
+            trace.series = da.convert_series_storage(trace.series + 1.0,
+                                                     'int64')
+        total = da.aggregate_traces(traces[:2],{})
+        np.testing.assert_array_equal(total.series.values,np.ones(24*4) * 2)
+        total = da.aggregate_traces(traces[:2],{},weights=[1,0.5])
+        np.testing.assert_array_equal(total.series.values,np.ones(24*4) * 1.5)
+
+    def test_bootstrap_appliance_set(self):
+        aligned_instances = da.align_instances(self.consecutive_instances)
+        for i, instance in enumerate(aligned_instances):
+            instance.traces[0].series = instance.traces[0].series + i
+        appliance_sets = [da.ApplianceSet(aligned_instances[:2],{}),
+                          da.ApplianceSet(aligned_instances[2:],{})]
+        sets = da.bootstrap_appliance_set(appliance_sets,3,4)
+        self.assertEqual(len(sets),4)
+        matrix, instances = da.stack_appliance_sets(appliance_sets)
+        self.assertEqual(matrix.shape,(24*4,5))
+        indices = np.array([[0,0,4],[1,2,3]])
+        totals = da.get_bootstrap_totals(matrix,indices)
+        np.testing.assert_array_equal(totals[:,0],[4,6])
+        np.testing.assert_array_equal(
+                da.get_bootstrap_totals(matrix,indices,chunk_size=1),totals)
+        np.random.seed(3)
+        expected_draw = np.random.rand()
+        np.random.seed(3)
+        seeded = [da.bootstrap_appliance_set(appliance_sets,3,4,
+                                             random_state=0)
+                  for _ in range(2)]
+        self.assertEqual(np.random.rand(),expected_draw)
+        for first, second in zip(*seeded):
+            np.testing.assert_array_equal(first.get_matrix(),
+                                          second.get_matrix())
+        for appliance_set in sets:
+            self.assertEqual(appliance_set.get_matrix().shape,(24*4,3))
+            aggregate = da.aggregate_instances(appliance_set.instances,{})
+            np.testing.assert_array_equal(
+                appliance_set.get_matrix().sum(axis=1),
+                aggregate.traces[0].series.values)
+
+    def test_stack_appliance_sets_front(self):
+        instances = [da.ApplianceInstance(self.consecutive_traces[:2],{}),
+                     da.ApplianceInstance(self.consecutive_traces[2:3],{})]
+        appliance_sets = [da.ApplianceSet(instances,{},validate=False)]
+        self.assertRaises(da.AlignmentError,da.stack_appliance_sets,
+                          appliance_sets)
+        matrix, stacked = da.stack_appliance_sets(appliance_sets,how="front")
+        self.assertEqual(matrix.shape,(24*4,2))
+        self.assertIs(stacked[0],instances[0])
+        self.assertEqual(len(stacked[0].traces),2)
+
     def test_aggregate_instances_misaligned(self):
         self.assertRaises(da.AlignmentError,
                           da.aggregate_instances,self.consecutive_instances,{})
@@ -62,5 +150,57 @@ class UtilsTestCase(unittest.TestCase):
         instance = da.concatenate_instances(self.consecutive_instances,{})
         self.assertEqual(instance.traces[0].series.index.size, 24 * 4 * 5)
 
+    def test_get_window_view(self):
+        values = np.arange(10,dtype=np.float64)
+        windows = da.get_window_view(values,4,2)
+        self.assertEqual(windows.shape,(3,4))
+        np.testing.assert_array_equal(windows[1],[2,3,4,5])
+        self.assertFalse(windows.flags.writeable)
+        sums = da.get_window_reductions(values,4,2,'sum')
+        np.testing.assert_array_equal(sums,windows.sum(axis=1))
+
+    def test_iter_trace_windows_batches(self):
+        batches = list(da.iter_trace_windows(self.consecutive_traces,8,8,
+                                             batch_size=25))
+        n_windows = sum(batch.shape[0] for batch in batches)
+        self.assertEqual(n_windows,5 * 11)
+        self.assertTrue(all(batch.shape[0] <= 25 for batch in batches))
+
+    def test_trace_series_to_numpy_array(self):
+        series = pd.Series([np.nan,1.0,np.nan,3.0])
+        zero = da.trace_series_to_numpy_array(series)
+        self.assertEqual(zero.shape,(4,1))
+        np.testing.assert_array_equal(zero[:,0],[0,1,0,3])
+        self.assertTrue(np.isnan(series[0]),'input should not be modified')
+        ffill = da.trace_series_to_numpy_array(series,'ffill')
+        np.testing.assert_array_equal(ffill[:,0],[0,1,1,3])
+        interp = da.trace_series_to_numpy_array(series,'interpolate')
+        np.testing.assert_array_equal(interp[:,0],[1,1,2,3])
+        masked = da.trace_series_to_numpy_array(series,'mask')
+        self.assertEqual(masked.mask.sum(),2)
+        out = np.empty((4,1))
+        result = da.trace_series_to_numpy_array(series,out=out)
+        self.assertIs(result,out)
+
+    def test_trace_series_to_numpy_array_no_copy(self):
+        values = np.arange(4,dtype=np.float64)
+        array = da.trace_series_to_numpy_array(values)
+        self.assertTrue(np.may_share_memory(array,values))
+
+    def test_parallel_map(self):
+        squares = da.parallel_map(lambda x: x * x, range(10), max_workers=4)
+        self.assertListEqual(squares,[x * x for x in range(10)])
+
+    def test_call_with_retries(self):
+        calls = []
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise IOError
+            return 'ok'
+        self.assertEqual(da.call_with_retries(flaky,n_retries=3,delay=0,
+                                              exceptions=(IOError,)),'ok')
+        self.assertEqual(len(calls),3)
+
 if __name__ == "__main__":
     unittest.main()